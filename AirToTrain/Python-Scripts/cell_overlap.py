@@ -0,0 +1,99 @@
+import pandas as pd
+import numpy as np
+from scipy import sparse
+from grid_cells import default_cell_grid, no_cell
+
+#########################################################################
+# Share of each trip's cells found on each reference route, all at once #
+#########################################################################
+
+
+def route_cell_ids(df, grid=default_cell_grid, cell_column='cell_id'):
+    """
+    :return: cell id of every reading, from cell_column when the data-frame already has it
+    """
+    if cell_column in df.columns:
+        return df[cell_column].to_numpy(dtype=np.int64)
+
+    return grid.cell_ids(df['latitude'].to_numpy(dtype=float), df['longitude'].to_numpy(dtype=float))
+
+
+def cell_set_matrix(set_ids, cell_ids, cell_columns):
+    """
+    Sparse 0/1 matrix with one row per set and one column per cell: the bit vector of every set's cells.
+    :param set_ids: row of each (set, cell) pair, 0..number of sets - 1
+    :param cell_columns: sorted array of every cell id in use, giving the column of each cell
+    """
+    has_cell = cell_ids != no_cell
+    rows, cols = set_ids[has_cell], np.searchsorted(cell_columns, cell_ids[has_cell])
+
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)),
+                               shape=(set_ids.max() + 1 if len(set_ids) else 0, len(cell_columns)))
+    # repeated readings in one cell only count once
+    matrix.data[:] = 1
+
+    return matrix
+
+
+def shared_cell_counts(df, references, grid=default_cell_grid, cell_column='cell_id'):
+    """
+    Encode every trip's cells and every reference route's cells as sparse bit vectors and count the shared cells
+    of all trip and reference pairs with one sparse product.
+    :return: (trip route numbers, reference names, trips x references shared cell counts, cells per trip)
+    """
+    names = list(references)
+    trip_numbers, trip_rows = np.unique(df['route_number'].to_numpy(), return_inverse=True)
+    trip_cells = route_cell_ids(df, grid, cell_column)
+
+    reference_rows = np.concatenate([np.full(len(references[name]), row) for row, name in enumerate(names)])
+    reference_cells = np.concatenate([route_cell_ids(references[name], grid, cell_column) for name in names])
+
+    cell_columns = np.unique(np.r_[trip_cells, reference_cells])
+    trips = cell_set_matrix(trip_rows.ravel(), trip_cells, cell_columns)
+    reference_sets = cell_set_matrix(reference_rows, reference_cells, cell_columns)
+
+    matched = (trips @ reference_sets.T).toarray()
+    route_cells = np.asarray(trips.sum(axis=1)).ravel()
+
+    return trip_numbers, names, matched, route_cells
+
+
+def overlap_matrix(df, references, grid=default_cell_grid, cell_column='cell_id'):
+    """
+    :return: data-frame of overlap ratios (share of the trip's cells on the reference), trips as rows and
+             references as columns
+    """
+    trip_numbers, names, matched, route_cells = shared_cell_counts(df, references, grid, cell_column)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = np.where(route_cells[:, None] > 0, matched / route_cells[:, None], 0.0)
+
+    return pd.DataFrame(ratios, index=pd.Index(trip_numbers, name='route_number'), columns=names)
+
+
+def score_cell_overlap(df, references, grid=default_cell_grid, fraud_threshold=0.8, cell_column='cell_id'):
+    """
+    Batched version of the cell comparison from the README: a trip is suspected fraud when less than
+    fraud_threshold of its cells are on its best matching reference route.
+    :param df: labeled readings of the trips
+    :param references: dict of name -> data-frame with latitude and longitude (or cell_column)
+    :return: data-frame indexed by route_number with route_cells, matched_cells, overlap_ratio, best_reference and
+             suspected_fraud
+    """
+    trip_numbers, names, matched, route_cells = shared_cell_counts(df, references, grid, cell_column)
+    best = np.argmax(matched, axis=1)
+    best_matched = matched[np.arange(len(trip_numbers)), best]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        overlap_ratio = np.where(route_cells > 0, best_matched / route_cells, 0.0)
+
+    scores = pd.DataFrame({'route_cells': route_cells,
+                           'matched_cells': best_matched,
+                           'overlap_ratio': overlap_ratio,
+                           'best_reference': np.array(names, dtype=object)[best],
+                           'suspected_fraud': overlap_ratio < fraud_threshold},
+                          index=pd.Index(trip_numbers, name='route_number'))
+
+    print(int(scores['suspected_fraud'].sum()), ' of ', len(scores), ' routes share less than ',
+          fraud_threshold * 100, '% of their cells with every reference route')
+    return scores
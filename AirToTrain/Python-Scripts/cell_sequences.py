@@ -0,0 +1,178 @@
+import pandas as pd
+import numpy as np
+from grid_cells import default_cell_grid, no_cell
+from cell_overlap import route_cell_ids
+from route_distances import sort_by_route_and_time, trip_starts
+import kernels
+
+####################################################################
+# Ordered sub-sequence similarity of cell paths, all pairs at once #
+####################################################################
+
+
+def collapse_repeats(cells, groups):
+    """
+    Drop readings outside the grid and readings in the same cell as the previous reading of the same group, so a
+    path is the order of the cells visited and not the number of readings in each.
+    :return: mask of the readings to keep
+    """
+    keep = cells != no_cell
+    kept = np.flatnonzero(keep)
+    repeated = np.zeros(len(kept), dtype=bool)
+    repeated[1:] = (cells[kept][1:] == cells[kept][:-1]) & (groups[kept][1:] == groups[kept][:-1])
+    keep[kept[repeated]] = False
+
+    return keep
+
+
+def trip_cell_paths(df, grid=default_cell_grid, cell_column='cell_id'):
+    """
+    :param df: labeled readings of the trips
+    :return: (route numbers, concatenated cell paths, offsets of each path with the total length at the end)
+    """
+    routes = sort_by_route_and_time(df)
+    route_numbers = routes['route_number'].to_numpy()
+    cells = route_cell_ids(routes, grid, cell_column)
+
+    keep = collapse_repeats(cells, np.cumsum(trip_starts(routes)))
+    trip_numbers, starts = np.unique(route_numbers[keep], return_index=True)
+
+    return trip_numbers, cells[keep], np.r_[starts, keep.sum()].astype(np.int64)
+
+
+def reference_cell_paths(references, grid=default_cell_grid, cell_column='cell_id'):
+    """
+    :param references: dict of name -> data-frame with latitude and longitude (or cell_column) in drawing order
+    :return: (names, list of cell paths)
+    """
+    names = list(references)
+    paths = []
+    for name in names:
+        cells = route_cell_ids(references[name], grid, cell_column)
+        paths.append(cells[collapse_repeats(cells, np.zeros(len(cells), dtype=np.int64))])
+
+    return names, paths
+
+
+def match_masks(paths):
+    """
+    Bit vectors of the reference paths: bit i of word i // 64 of masks[reference, symbol] is set when position i of
+    the reference is that cell.
+    :return: (sorted cells of every reference, uint64 masks (references, cells, words), reference lengths)
+    """
+    alphabet = np.unique(np.concatenate(paths)) if paths else np.zeros(0, dtype=np.int64)
+    lengths = np.array([len(path) for path in paths], dtype=np.int64)
+    words = max(1, int(np.ceil(lengths.max() / 64.0))) if len(paths) else 1
+
+    masks = np.zeros((len(paths), len(alphabet), words), dtype=np.uint64)
+    for reference, path in enumerate(paths):
+        positions = np.arange(len(path))
+        np.bitwise_or.at(masks, (reference, np.searchsorted(alphabet, path), positions // 64),
+                         np.left_shift(np.uint64(1), (positions % 64).astype(np.uint64)))
+
+    return alphabet, masks, lengths
+
+
+def to_symbols(cells, alphabet):
+    """
+    :return: index of every cell in alphabet, -1 for cells on no reference (they can't be part of any match)
+    """
+    found = np.minimum(np.searchsorted(alphabet, cells), max(len(alphabet) - 1, 0))
+    return np.where((len(alphabet) > 0) & (alphabet[found] == cells), found, -1).astype(np.int64)
+
+
+def count_zeros(v, lengths):
+    """
+    :param v: uint64 bit vectors (..., references, words)
+    :return: zero bits among the first lengths[reference] bits of every vector
+    """
+    words = v.shape[-1]
+    bits = np.clip(lengths[:, None] - 64 * np.arange(words)[None, :], 0, 64).astype(np.uint64)
+    valid = np.where(bits == 64, ~np.uint64(0), (np.uint64(1) << np.minimum(bits, np.uint64(63))) - np.uint64(1))
+
+    zeros = ~v & valid
+    return np.unpackbits(zeros.view(np.uint8), axis=-1).reshape(zeros.shape[:-1] + (-1,)).sum(axis=-1)
+
+
+def lcs_lengths(symbols, offsets, masks, lengths):
+    """
+    Bit-parallel LCS (Hyyro's V' = (V + (V & M)) | (V & ~M)) of every sequence against every reference. The numpy
+    version steps through position j of all sequences at once, longest first, so each step only touches the
+    sequences that are still running; kernels.lcs_lengths_compiled does the same one sequence at a time.
+    :param symbols: concatenated sequences as alphabet indices from to_symbols
+    :param offsets: start of each sequence, plus the total length at the end
+    :return: int64 array (sequences, references) of LCS lengths
+    """
+    if kernels.use_compiled():
+        return kernels.lcs_lengths_compiled(symbols, offsets, masks, lengths)
+
+    sequence_lengths = np.diff(offsets)
+    order = np.argsort(-sequence_lengths, kind='stable')
+    starts = offsets[:-1][order]
+    # number of sequences longer than j, for every position j
+    longest = sequence_lengths.max() if len(order) else 0
+    running = len(order) - np.searchsorted(np.sort(sequence_lengths), np.arange(longest), side='right')
+
+    references, _, words = masks.shape
+    # an all zero row for symbols on no reference, which leaves V unchanged
+    masks = np.concatenate([masks, np.zeros((references, 1, words), dtype=np.uint64)], axis=1).transpose(1, 0, 2)
+    symbols = np.where(symbols < 0, masks.shape[0] - 1, symbols)
+
+    v = np.full((len(order), references, words), ~np.uint64(0), dtype=np.uint64)
+    for j, count in enumerate(running):
+        active = v[:count]
+        mask = masks[symbols[starts[:count] + j]]
+        u = active & mask
+
+        carry = np.zeros(active.shape[:-1], dtype=np.uint64)
+        for w in range(words):
+            total = active[..., w] + u[..., w]
+            overflow = total < active[..., w]
+            total_with_carry = total + carry
+            overflow |= total_with_carry < total
+            active[..., w] = total_with_carry | (active[..., w] & ~mask[..., w])
+            carry = overflow.astype(np.uint64)
+
+    result = np.zeros((len(order), references), dtype=np.int64)
+    result[order] = count_zeros(v, lengths)
+
+    return result
+
+
+def sequence_similarity(df, references, grid=default_cell_grid, fraud_threshold=0.8, cell_column='cell_id'):
+    """
+    Ordered version of the cell comparison: the longest common sub-sequence of a trip's cell path and each reference
+    path counts the cells visited in the reference's order, so a trip that drives a corridor backwards or doubles
+    back scores lower than with the unordered overlap.
+    :param df: labeled readings of the trips
+    :param references: dict of name -> data-frame with latitude and longitude (or cell_column) in drawing order
+    :return: data-frame indexed by route_number with path_cells, matched_cells (LCS with the best reference),
+             sequence_ratio (matched share of the trip's path), reference_coverage (matched share of the reference's
+             path), best_reference and suspected_fraud (sequence_ratio below fraud_threshold)
+    """
+    trip_numbers, cells, offsets = trip_cell_paths(df, grid, cell_column)
+    names, paths = reference_cell_paths(references, grid, cell_column)
+    alphabet, masks, lengths = match_masks(paths)
+
+    matched = lcs_lengths(to_symbols(cells, alphabet), offsets, masks, lengths)
+    path_cells = np.diff(offsets)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = np.where(path_cells[:, None] > 0, matched / path_cells[:, None], 0.0)
+    best = np.argmax(ratios, axis=1)
+    rows = np.arange(len(trip_numbers))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coverage = np.where(lengths[best] > 0, matched[rows, best] / lengths[best], 0.0)
+
+    scores = pd.DataFrame({'path_cells': path_cells,
+                           'matched_cells': matched[rows, best],
+                           'sequence_ratio': ratios[rows, best],
+                           'reference_coverage': coverage,
+                           'best_reference': np.array(names, dtype=object)[best],
+                           'suspected_fraud': ratios[rows, best] < fraud_threshold},
+                          index=pd.Index(trip_numbers, name='route_number'))
+
+    print(int(scores['suspected_fraud'].sum()), ' of ', len(scores), ' routes follow less than ',
+          fraud_threshold * 100, '% of their cell path along every reference route')
+    return scores
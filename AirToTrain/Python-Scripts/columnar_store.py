@@ -0,0 +1,145 @@
+import os
+import time
+import shutil
+import pandas as pd
+import numpy as np
+from time_parsing import parse_gps_times
+
+##############################################################
+# Parquet storage for the data passed between pipeline steps #
+##############################################################
+
+compact_column_types = {
+    'latitude': np.float32,
+    'longitude': np.float32,
+    'occupancy_status': np.uint8,
+    'speed': np.int16,
+    'direction': np.int16,
+    'route_number': np.int32,
+    'row': np.int16,
+    'column': np.int16,
+    'cell_id': np.int32,
+    'morton_code': np.uint32,
+}
+
+
+def compact_dtypes(df, categories=True):
+    """
+    Shrink the usual GPS columns: float32 coordinates, small integers, native timestamps and categorical
+    cells. Numeric taxi ids become int32 and hashed string ids (new data) become categorical.
+    :param categories: False keeps string ids and cells as plain strings, for files that are read back together
+                       with others (a category's dictionary index width depends on the categories of its file)
+    """
+    dtypes = {}
+
+    for col, dtype in compact_column_types.items():
+        # integer columns holding NaN stay as they are
+        if col in df.columns and (dtype == np.float32 or pd.api.types.is_integer_dtype(df[col])):
+            dtypes[col] = dtype
+
+    if 'taxi_id' in df.columns:
+        if pd.api.types.is_integer_dtype(df['taxi_id']):
+            dtypes['taxi_id'] = np.int32
+        elif categories:
+            dtypes['taxi_id'] = 'category'
+
+    if 'cell' in df.columns and categories:
+        dtypes['cell'] = 'category'
+
+    df = df.astype(dtypes)
+
+    if 'time' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['time']):
+        df['time'] = parse_gps_times(df['time'])
+
+    return df
+
+
+def save_df_as_parquet(df, file_name, sub_directories='/', partition_cols=None):
+    """
+    Save a data-frame with compact dtypes. With partition_cols a directory with one folder per value is written
+    and readers can skip the partitions they don't need.
+    """
+    full_path = os.getcwd() + sub_directories + file_name
+
+    # partitioned writes add files next to whatever is already there
+    if partition_cols is not None and os.path.isdir(full_path):
+        shutil.rmtree(full_path)
+
+    compact_dtypes(df).to_parquet(full_path, partition_cols=partition_cols)
+
+
+def append_df_to_parquet_dataset(df, dataset_name, part_number, sub_directories='/'):
+    """
+    Write df as the part_number file of a dataset directory. load_parquet_as_df reads the whole directory.
+    Call clear_parquet_dataset first so parts of an earlier run aren't read back with the new ones.
+    """
+    dataset_path = os.getcwd() + sub_directories + dataset_name
+    os.makedirs(dataset_path, exist_ok=True)
+
+    part_path = dataset_path + '/part-' + str(part_number).zfill(5) + '.parquet'
+    compact_dtypes(df, categories=False).to_parquet(part_path)
+
+
+def clear_parquet_dataset(dataset_name, sub_directories='/'):
+    dataset_path = os.getcwd() + sub_directories + dataset_name
+
+    if os.path.isdir(dataset_path):
+        shutil.rmtree(dataset_path)
+
+
+def load_parquet_as_df(file_name, sub_directories='/', columns=None, filters=None):
+    """
+    Parquet version of load_csv_as_df. Timestamps come back parsed so there is no parse_gps_times pass.
+    :param columns: only read these columns
+    :param filters: pyarrow filters, e.g. [('route_number', 'in', [2199, 68764])]
+    """
+    full_path = os.getcwd() + sub_directories + file_name
+    return pd.read_parquet(full_path, columns=columns, filters=filters)
+
+
+def directory_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def benchmark_formats(df, file_name='benchmark'):
+    """
+    Time a CSV round trip (timestamps parsed on the way back in) against a Parquet round trip and compare file sizes.
+    :return: data-frame with one row per format
+    """
+    csv_path = file_name + '.csv'
+    parquet_path = file_name + '.parquet'
+    results = []
+
+    if not pd.api.types.is_datetime64_any_dtype(df['time']):
+        df = df.assign(time=parse_gps_times(df['time']))
+
+    start = time.time()
+    df.to_csv(csv_path, encoding='utf-8', index=False)
+    csv_write = time.time() - start
+
+    start = time.time()
+    csv_df = pd.read_csv(csv_path)
+    csv_df['time'] = parse_gps_times(csv_df['time'])
+    csv_read = time.time() - start
+    results.append(('csv', csv_write, csv_read, directory_size(csv_path)))
+
+    start = time.time()
+    compact_dtypes(df).to_parquet(parquet_path)
+    parquet_write = time.time() - start
+
+    start = time.time()
+    pd.read_parquet(parquet_path)
+    parquet_read = time.time() - start
+    results.append(('parquet', parquet_write, parquet_read, directory_size(parquet_path)))
+
+    os.remove(csv_path)
+    os.remove(parquet_path)
+
+    results_df = pd.DataFrame(results, columns=['format', 'write_seconds', 'read_seconds', 'bytes'])
+    print(results_df)
+    print('Read speedup: ', csv_read / parquet_read, ' size reduction: ', results_df['bytes'].iloc[0] / results_df['bytes'].iloc[1])
+
+    return results_df
@@ -0,0 +1,185 @@
+import os
+import pandas as pd
+import numpy as np
+from trajectory_index import TrajectoryIndex, contiguous_runs
+from route_distances import sort_by_route_and_time, segment_distances
+from simplify_routes import to_local_meters, distances_to_segments
+
+##################################################################
+# Distance from every GPS reading to the nearest reference route #
+##################################################################
+
+air_to_train_reference_files = ['BottomRoute.csv', 'MiddleRoute.csv', 'TopRoute.csv', 'TrainToAirMiddle.csv']
+
+train_to_train_reference_files = ['North-Train-To-West-Left-Google-Maps-Route-Cells.csv',
+                                  'North-Train-To-West-Middle-Google-Maps-Route-Cells.csv',
+                                  'West-Train-To-North-Bottom-Google-Maps-Route-Cells.csv',
+                                  'West-Train-To-North-Middle-Google-Maps-Route-Cells.csv',
+                                  'West-Train-To-North-Top-Google-Maps-Route-Cells.csv']
+
+
+def load_reference_route(file_name, sub_directories='/'):
+    """
+    Read a Google Maps polyline. The AirToTrain files have no header row, the TrainToTrain cell files have
+    latitude/longitude (and cell) columns.
+    :return: data-frame with latitude and longitude
+    """
+    full_path = os.getcwd() + sub_directories + file_name
+    df = pd.read_csv(full_path)
+
+    if 'latitude' not in df.columns:
+        df = pd.read_csv(full_path, header=None, usecols=[0, 1])
+        df.columns = ['latitude', 'longitude']
+
+    return df[['latitude', 'longitude']]
+
+
+def load_reference_routes(file_names, sub_directories='/'):
+    return {file_name.replace('.csv', ''): load_reference_route(file_name, sub_directories) for file_name in file_names}
+
+
+class ReferenceRouteIndex(object):
+    """
+    Every segment of a set of reference polylines in a uniform grid (cell_size_m on a side, local meters). A segment
+    is listed in every cell its bounding box touches, so any segment closer than cell_size_m to a point is in the 3x3
+    cells around it. Points with nothing that close are checked against every segment, which is exact and cheap
+    because reference routes only have a few hundred segments.
+    """
+
+    def __init__(self, references, cell_size_m=500.0):
+        """
+        :param references: dict of name -> data-frame with latitude and longitude in drawing order
+        """
+        self.names = list(references)
+        self.cell_size_m = cell_size_m
+
+        lats = [references[name]['latitude'].to_numpy(dtype=float) for name in self.names]
+        longs = [references[name]['longitude'].to_numpy(dtype=float) for name in self.names]
+        self.reference_lat = np.mean(np.concatenate(lats))
+
+        x_one, y_one, x_two, y_two, reference_ids = [], [], [], [], []
+        for reference_id, (lat, long) in enumerate(zip(lats, longs)):
+            x, y = to_local_meters(lat, long, self.reference_lat)
+            x_one.append(x[:-1])
+            y_one.append(y[:-1])
+            x_two.append(x[1:])
+            y_two.append(y[1:])
+            reference_ids.append(np.full(len(x) - 1, reference_id))
+
+        self.x_one, self.y_one = np.concatenate(x_one), np.concatenate(y_one)
+        self.x_two, self.y_two = np.concatenate(x_two), np.concatenate(y_two)
+        self.reference_ids = np.concatenate(reference_ids)
+
+        self.min_x = np.minimum(self.x_one, self.x_two).min()
+        self.min_y = np.minimum(self.y_one, self.y_two).min()
+        first_cols, last_cols = self.cells(np.minimum(self.x_one, self.x_two)), self.cells(np.maximum(self.x_one, self.x_two))
+        first_rows, last_rows = self.cells(np.minimum(self.y_one, self.y_two), True), \
+            self.cells(np.maximum(self.y_one, self.y_two), True)
+        self.cols = int(last_cols.max()) + 1
+
+        # (cell, segment) pairs sorted by cell, with offsets to look up a cell's segments
+        cell_ids, segment_ids = [], []
+        for segment in range(len(self.x_one)):
+            rows = np.arange(first_rows[segment], last_rows[segment] + 1)
+            cols = np.arange(first_cols[segment], last_cols[segment] + 1)
+            cell_ids.append((rows[:, None] * self.cols + cols[None, :]).ravel())
+            segment_ids.append(np.full(len(rows) * len(cols), segment))
+
+        cell_ids, segment_ids = np.concatenate(cell_ids), np.concatenate(segment_ids)
+        order = np.argsort(cell_ids, kind='stable')
+        self.cell_keys, cell_starts, cell_stops = contiguous_runs(cell_ids[order])
+        self.cell_starts, self.cell_stops = cell_starts, cell_stops
+        self.cell_segments = segment_ids[order]
+
+    def cells(self, values, rows=False):
+        origin = self.min_y if rows else self.min_x
+        return np.floor((values - origin) / self.cell_size_m).astype(np.int64)
+
+    def nearest(self, lat, long):
+        """
+        :return: (distance in meters to the nearest reference segment, id of that segment's reference) per point
+        """
+        x, y = to_local_meters(np.asarray(lat, dtype=float), np.asarray(long, dtype=float), self.reference_lat)
+        rows, cols = self.cells(y, True), self.cells(x)
+
+        best = np.full(len(x), np.inf)
+        best_segment = np.full(len(x), -1, dtype=np.int64)
+
+        for row_step in (-1, 0, 1):
+            for col_step in (-1, 0, 1):
+                neighbour_cols = cols + col_step
+                cell_ids = (rows + row_step) * self.cols + neighbour_cols
+                found = np.searchsorted(self.cell_keys, cell_ids)
+                found = np.minimum(found, len(self.cell_keys) - 1)
+                hit = (self.cell_keys[found] == cell_ids) & (neighbour_cols >= 0) & (neighbour_cols < self.cols)
+
+                points = np.flatnonzero(hit)
+                starts, stops = self.cell_starts[found[points]], self.cell_stops[found[points]]
+                self.closest(x, y, np.repeat(points, stops - starts),
+                             self.cell_segments[TrajectoryIndex.ranges_to_positions(starts, stops)], best, best_segment)
+
+        # exact answer for points far from every reference
+        far = np.flatnonzero(best >= self.cell_size_m)
+        for chunk in np.array_split(far, max(1, len(far) * len(self.x_one) // 10000000 + 1)):
+            points = np.repeat(chunk, len(self.x_one))
+            self.closest(x, y, points, np.tile(np.arange(len(self.x_one)), len(chunk)), best, best_segment)
+
+        return best, np.where(best_segment >= 0, self.reference_ids[np.maximum(best_segment, 0)], -1)
+
+    def closest(self, x, y, points, segments, best, best_segment):
+        """
+        Keep the closer of the current best and every (point, candidate segment) pair.
+        :param points: point of each pair, pairs of one point next to each other
+        """
+        if len(points) == 0:
+            return
+
+        distances = distances_to_segments(x[points], y[points], self.x_one[segments], self.y_one[segments],
+                                          self.x_two[segments], self.y_two[segments])
+
+        group_starts = np.flatnonzero(np.r_[True, points[1:] != points[:-1]])
+        minimums = np.minimum.reduceat(distances, group_starts)
+        lengths = np.diff(np.r_[group_starts, len(points)])
+
+        candidates = np.flatnonzero(distances == np.repeat(minimums, lengths))
+        first = candidates[np.r_[True, points[candidates][1:] != points[candidates][:-1]]]
+        closer = distances[first] < best[points[first]]
+
+        best[points[first[closer]]] = distances[first[closer]]
+        best_segment[points[first[closer]]] = segments[first[closer]]
+
+
+def corridor_deviation(df, reference_index, corridor_width_m=200.0):
+    """
+    Score every route against a corridor of reference routes.
+    :param df: labeled data-frame
+    :param reference_index: ReferenceRouteIndex of the corridor's reference routes
+    :param corridor_width_m: readings farther than this from every reference are off the corridor
+    :return: data-frame indexed by route_number with max_deviation_m, mean_deviation_m, off_corridor_km,
+             off_corridor_share (of the path length) and closest_reference (reference nearest to most readings)
+    """
+    routes = sort_by_route_and_time(df)
+    deviations, reference_ids = reference_index.nearest(routes['latitude'].to_numpy(dtype=float),
+                                                         routes['longitude'].to_numpy(dtype=float))
+
+    # a move counts as off the corridor when it ends off the corridor
+    segments = segment_distances(routes)
+    routes = routes.assign(deviation_m=deviations, reference_id=reference_ids,
+                           segment_distance_km=segments, off_corridor_km=np.where(deviations > corridor_width_m,
+                                                                                  segments, 0.0))
+
+    grouped = routes.groupby('route_number', sort=True)
+    scores = pd.DataFrame({'max_deviation_m': grouped['deviation_m'].max(),
+                           'mean_deviation_m': grouped['deviation_m'].mean(),
+                           'off_corridor_km': grouped['off_corridor_km'].sum()})
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores['off_corridor_share'] = scores['off_corridor_km'] / grouped['segment_distance_km'].sum()
+
+    votes = routes.groupby(['route_number', 'reference_id']).size().reset_index(name='readings')
+    votes = votes.sort_values(['route_number', 'readings'], ascending=[True, False]).drop_duplicates('route_number')
+    names = np.array(reference_index.names, dtype=object)
+    scores['closest_reference'] = pd.Series(names[votes['reference_id'].to_numpy()],
+                                            index=votes['route_number'].to_numpy())
+
+    return scores
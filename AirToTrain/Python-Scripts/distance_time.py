@@ -1,144 +1,69 @@
 import pandas as pd
-import mpu
+import numpy as np
 import os
+from time_parsing import parse_gps_times
+from trajectory_index import TrajectoryIndex
+from route_distances import haversine_km, route_segment_distances
 
 ######################################
 # Add Distance and Duration to Routes#
 ######################################
 
 
-def lookup(s):
+def calculate_route_durations(df):
     """
-    This is an extremely fast approach to datetime parsing.
-    For large data, the same dates are often repeated. Rather than
-    re-parse these, we store all unique dates, parse them, and
-    use a lookup to convert all dates.
+    Seconds between the first route_start reading and the first route_end reading of every route.
+    :return: data-frame with route_number and duration_in_seconds, routes missing a start or an end are left out
     """
-    dates = {date: pd.to_datetime(date) for date in s.unique()}
-    return s.map(dates)
-
-
-def calculate_route_durations(df):
-    route_durations = {}
-    df['time'] = lookup(df['time'])
+    df['time'] = parse_gps_times(df['time'])
     route_ids = df['route_number'].unique()
 
-    for route_id in route_ids:
-        route_df = df[df['route_number'] == route_id]
-
-        start_row = route_df[route_df['route_start'] == True]
-        end_row = route_df[route_df['route_end'] == True]
-
-        has_start_and_end = True
-        if len(start_row) == 0:
-            print('No start for route: ', route_id)
-            has_start_and_end = False
-
-        if len(end_row) == 0:
-            print('No end for route: ', route_id)
-            has_start_and_end = False
-
-        if has_start_and_end:
-            start_time = start_row['time'].iloc[0]
-            end_time = end_row['time'].iloc[0]
+    start_times = reduce_dataframe_by_col(df[df['route_start'] == True], 'route_number').set_index('route_number')
+    end_times = reduce_dataframe_by_col(df[df['route_end'] == True], 'route_number').set_index('route_number')
+    has_start_and_end = route_ids[np.isin(route_ids, start_times.index) & np.isin(route_ids, end_times.index)]
 
-            if end_time < start_time:
-                print('End time earlier than start time for route number ', route_id)
-                print()
+    durations = end_times.loc[has_start_and_end, 'time'] - start_times.loc[has_start_and_end, 'time']
+    duration_df = pd.DataFrame({'route_number': has_start_and_end,
+                                'duration_in_seconds': durations.dt.total_seconds().to_numpy()})
 
-            route_duration = end_time - start_time
-            # print('route_duration ', route_duration)
-
-            duration_in_seconds = route_duration.total_seconds()
-
-            print('Route ', route_id, ' duration in seconds ', duration_in_seconds)
-
-            route_durations[route_id] = duration_in_seconds
-
-    duration_df = pd.DataFrame(list(route_durations.items()), columns=['route_number', 'duration_in_seconds'])
+    print(len(route_ids) - len(has_start_and_end), ' of ', len(route_ids), ' routes have no start or no end')
+    print((duration_df['duration_in_seconds'] < 0).sum(), ' routes end earlier than they start')
     return duration_df
 
 
 def distance_between_gps(gps_one, gps_two):
-    km_distance = mpu.haversine_distance((gps_one[0], gps_one[1]), (gps_two[0], gps_two[1]))
-
-    if km_distance < 0:
-        print('got negative distance that\'s weak')
-        km_distance *= -1
-
-    return km_distance
+    return float(haversine_km(gps_one[0], gps_one[1], gps_two[0], gps_two[1]))
 
 
 def calculate_route_distances(df):
-    route_distances = {}
-    df['time'] = lookup(df['time'])
-    route_ids = df['route_number'].unique()
-
-    for route_id in route_ids:
-        route_df = df[df['route_number'] == route_id]
-        route_df.sort_values('time')
-        route_df.reset_index(drop=True)
-
-        distance_sum = 0.0
-        is_first_row = True
-
-        print('starting on route number', route_id)
-        print(route_df.index)
-
-        for index, row in route_df.iterrows():
-            print('index', index)
-            if not is_first_row:
-                last_row = route_df.loc[index - 1]
-                last_lat = last_row['latitude']
-                last_long = last_row['longitude']
-                last_gps = (last_lat, last_long)
-
-                current_lat = row['latitude']
-                current_long = row['longitude']
-                current_gps = (current_lat, current_long)
-
-                distance_between_rows = distance_between_gps(last_gps, current_gps)
-                print('distance between rows', distance_between_rows)
-
-                distance_sum += distance_between_rows
-            else:
-                is_first_row = False
+    """
+    Path length of every route: haversine over consecutive readings in time order, summed per route.
+    :return: data-frame with route_number and distance_in_km
+    """
+    df['time'] = parse_gps_times(df['time'])
+    _, route_distances = route_segment_distances(df)
 
-        route_distances[route_id] = distance_sum
+    return route_distances.reset_index()
 
-    distance_df = pd.DataFrame(list(route_distances.items()), columns=['route_number', 'distance_in_km'])
-    return distance_df
 
+def merge_distance_time_into_route_df(dt_df, df, index=None):
+    if index is None:
+        index = TrajectoryIndex(df)
 
-def merge_distance_time_into_route_df(dt_df, df):
-    route_dfs = []
+    dt_df = dt_df.drop_duplicates('route_number').set_index('route_number')
     route_ids = df['route_number'].unique()
+    route_ids = route_ids[np.isin(route_ids, dt_df.index)]
 
-    for route_id in route_ids:
-        route_df = df[df['route_number'] == route_id]
-        distance_time_df = dt_df[dt_df['route_number'] == route_id]
-
-        distance = distance_time_df['distance_in_km'].iloc[0]
-        time = distance_time_df['duration_in_seconds'].iloc[0]
-
-        route_df['distance_in_km'] = distance
-        route_df['duration_in_seconds'] = time
-
-        route_dfs.append(route_df)
+    route_lengths = index.route_lengths().reindex(route_ids).to_numpy()
+    route_df = index.routes(route_ids)
 
-    return pd.concat(route_dfs)
+    return route_df.assign(distance_in_km=np.repeat(dt_df.loc[route_ids, 'distance_in_km'].to_numpy(), route_lengths),
+                           duration_in_seconds=np.repeat(dt_df.loc[route_ids, 'duration_in_seconds'].to_numpy(),
+                                                         route_lengths))
 
 
 def reduce_dataframe_by_col(df, col_name):
-    row_dfs = []
-    unique_values = df[col_name].unique()
-
-    for val in unique_values:
-        val_df = df[df[col_name] == val]
-
-        row_dfs.append(val_df.iloc[[0]])
-
-    return pd.concat(row_dfs)
+    return df.drop_duplicates(col_name, keep='first')
 
 
 def load_google_map_dfs():
@@ -1,6 +1,9 @@
 import os
 import pandas as pd
 import numpy as np
+from segment_trajectories import segment_trajectories
+from regions import shenzhen_regions
+from route_summary import route_endpoints, classify_endpoints, find_routes_between
 
 ######################################################################################
 # Find Trajectories from Airport to Train Station (both directions) in Shenzhen China#
@@ -25,251 +28,74 @@ def load_csv_as_df(file_name, sub_directories, column_numbers=None, column_names
     return df
 
 
-def lookup(s):
-    """
-    This is an extremely fast approach to datetime parsing.
-    For large data, the same dates are often repeated. Rather than
-    re-parse these, we store all unique dates, parse them, and
-    use a lookup to convert all dates.
-    """
-    dates = {date: pd.to_datetime(date) for date in s.unique()}
-    return s.map(dates)
-
-
 def label_trajectories(df):
-    updated_dfs = []
-    taxi_ids = df['taxi_id'].unique()
-    print('There are ', len(taxi_ids), ' unique taxi ids in this data')
-    empty_route = -1
-    trajectory_number = 1
-
-    completed_count = 0
-
-    for taxi_id in taxi_ids:
-        # get the df for that taxis
-        taxi_df = df.loc[df['taxi_id'] == taxi_id]
-        taxi_df['time'] = lookup(taxi_df['time'])
-        taxi_df.sort_values(by=['time'], inplace=True)
-
-        passenger_got_in = False
-        route_numbers = []
-        route_starts = []
-        route_ends = []
-
-        for index, row in taxi_df.iterrows():
-            passenger_in_taxi = row['occupancy_status']
-
-            # Do we already have a passenger?
-            if passenger_got_in:
-                if passenger_in_taxi:
-                    # trajectory still going
-                    route_starts.append(False)
-                    route_ends.append(False)
-                    route_numbers.append(trajectory_number)
-                    continue
-                elif not passenger_in_taxi:
-                    # trajectory ended
-                    passenger_got_in = False
-                    route_starts.append(False)
-                    route_ends.append(True)
-                    route_numbers.append(trajectory_number)
-                    trajectory_number += 1
-
-            elif passenger_in_taxi:
-                passenger_got_in = True
-                route_starts.append(True)
-                route_ends.append(False)
-                route_numbers.append(trajectory_number)
-
-            else:
-                route_starts.append(False)
-                route_ends.append(False)
-                route_numbers.append(empty_route)
-
-        taxi_df['route_number'] = route_numbers
-        taxi_df['route_start'] = route_starts
-        taxi_df['route_end'] = route_ends
-        updated_dfs.append(taxi_df)
-        completed_count += 1
-
-        if completed_count % 1000 == 0:
-            print('Completed ', completed_count, ' taxi_ids out of ', len(taxi_ids))
-
-    return pd.concat(updated_dfs)
+    df, trajectory_number = segment_trajectories(df)
+    return df
 
 
 def find_trajectories_at_airport_or_train(df):
-    relevant_route_numbers = []
-    relevant_cols = ['latitude', 'longitude', 'route_number', 'route_start']
-    route_numbers = df.route_number.unique()
-
-    number_of_trajectories = len(route_numbers) - 1
-
-    for route_number in route_numbers:
-        if route_number != -1:
-
-            if route_number % 10000 == 0:
-                print('On route number ', route_number, ' out of ', number_of_trajectories)
-                print('Currently found ', len(relevant_route_numbers), ' relevant routes')
-
-            start_row = df[relevant_cols][(df['route_start'] == True) & (df['route_number'] == route_number)]
-            end_row = df[relevant_cols][(df['route_end'] == True) & (df['route_number'] == route_number)]
-
-            # print(start_row)
-            # print(end_row)
+    endpoints = classify_endpoints(route_endpoints(df))
 
-            start_lat = start_row['latitude'].iloc[0]
-            start_long = start_row['longitude'].iloc[0]
-
-            end_lat = end_row['latitude'].iloc[0]
-            end_long = end_row['longitude'].iloc[0]
-
-            if near_airport(start_lat, start_long) and near_train_station(end_lat, end_long):
-                relevant_route_numbers.append(route_number)
-            elif near_bus_station(start_lat, start_long) and near_train_station(end_lat, end_long):
-                relevant_route_numbers.append(route_number)
+    relevant_route_numbers = find_routes_between(endpoints, 'airport', 'north_train_station')
+    relevant_route_numbers += find_routes_between(endpoints, 'bus_station', 'north_train_station')
 
+    print('Found ', len(relevant_route_numbers), ' relevant routes out of ', len(endpoints))
     return relevant_route_numbers
 
 
 def near_airport(lat, long):
-    if 22.605770 <= lat <= 22.667089 and 113.784647 <= long <= 113.837340:
-        return True
-    else:
-        return False
+    return shenzhen_regions.contains('airport', lat, long)
 
 
 def near_bus_station(lat, long):
-    if 22.567210 <= lat <= 22.568807 and 114.089676 <= long <= 114.091320:
-        return True
-    else:
-        return False
+    return shenzhen_regions.contains('bus_station', lat, long)
 
 
 def near_train_station(lat, long):
-    if 22.604998 <= lat <= 22.614221 and 114.021111 <= long <= 114.034778:
-        return True
-    else:
-        return False
+    return shenzhen_regions.contains('north_train_station', lat, long)
 
 
-def filter_data_by_gps(df, with_pass=False):
-    # Airport in Shenzhen is 22.627078, 113.804928 and 22.606742, 113.827262.
-    # Train Station in Shenzhen is 22.605502, 114.023724 and 22.613580, 114.034568.
-
+def filter_data_by_region(df, region_name, with_pass=False):
+    """
+    :param region_name: name of a region in regions.json
+    :param with_pass: only keep readings with a passenger
+    :return: readings inside the region
+    """
     all_taxi_ids = df['taxi_id'].unique()
     print('There are ', len(all_taxi_ids), ' taxi ids in this dataset!')
 
-    near_lat = df[(df['latitude'] >= 22.606742) & (df['latitude'] <= 22.627078)]
-    print('There are ', len(near_lat), ' GPS readings near the latitude of the airport')
-
-    near_airport = near_lat[(near_lat['longitude'] >= 113.804928) & (near_lat['longitude'] <= 113.827262)]
+    inside = shenzhen_regions.contains(region_name, df['latitude'].to_numpy(dtype=float),
+                                       df['longitude'].to_numpy(dtype=float))
+    near_region = df[inside]
 
-    print('There are ', len(near_airport), ' GPS readings near the airport!')
-    taxi_ids = near_airport['taxi_id'].unique()
-    print('There are ', len(taxi_ids), ' taxi ids near the airport!')
+    print('There are ', len(near_region), ' GPS readings near the ', region_name, '!')
+    taxi_ids = near_region['taxi_id'].unique()
+    print('There are ', len(taxi_ids), ' taxi ids near the ', region_name, '!')
 
     if with_pass:
-        with_pass = near_airport[near_airport['occupancy_status'] == 1]
-        print('There are ', len(with_pass), ' GPS readings near the airport with a passenger!')
+        with_pass = near_region[near_region['occupancy_status'] == 1]
+        print('There are ', len(with_pass), ' GPS readings near the ', region_name, ' with a passenger!')
         with_pass_ids = with_pass['taxi_id'].unique()
-        print('There are ', len(with_pass_ids), ' taxi ids near the airport with a passenger!')
+        print('There are ', len(with_pass_ids), ' taxi ids near the ', region_name, ' with a passenger!')
         return with_pass
     else:
-        return near_airport
-
-
-def filter_data_by_train_gps(df, with_pass=False):
-    # Train Station in Shenzhen is 22.605502, 114.023724 and 22.613580, 114.034568.
-    all_taxi_ids = df['taxi_id'].unique()
-    print('There are ', len(all_taxi_ids), ' taxi ids in this dataset!')
+        return near_region
 
-    near_lat = df[(df['latitude'] >= 22.605502) & (df['latitude'] <= 22.613580)]
-    print('There are ', len(near_lat), ' GPS readings near the latitude of the airport')
 
-    near_airport = near_lat[(near_lat['longitude'] >= 114.023724) & (near_lat['longitude'] <= 114.034568)]
+def filter_data_by_gps(df, with_pass=False):
+    return filter_data_by_region(df, 'airport_core', with_pass)
 
-    print('There are ', len(near_airport), ' GPS readings near the airport!')
-    taxi_ids = near_airport['taxi_id'].unique()
-    print('There are ', len(taxi_ids), ' taxi ids near the airport!')
 
-    if with_pass:
-        with_pass = near_airport[near_airport['occupancy_status'] == 1]
-        print('There are ', len(with_pass), ' GPS readings near the airport with a passenger!')
-        with_pass_ids = with_pass['taxi_id'].unique()
-        print('There are ', len(with_pass_ids), ' taxi ids near the airport with a passenger!')
-        return with_pass
-    else:
-        return near_airport
+def filter_data_by_train_gps(df, with_pass=False):
+    return filter_data_by_region(df, 'north_train_station_core', with_pass)
 
 
-def get_taxi_data_near_airport_data(near_airport, full_df):
+def get_taxi_data_near_airport_data(near_airport, full_df, index=None):
     taxi_ids = near_airport['taxi_id'].unique()
 
+    if index is not None:
+        return index.taxis(taxi_ids)
+
     relevant_taxis = full_df[full_df['taxi_id'].isin(taxi_ids)]
 
     return relevant_taxis
-
-
-def label_trajectories(df):
-    df['time'] = lookup(df['time'])
-    updated_dfs = []
-    taxi_ids = df['taxi_id'].unique()
-    print('There are ', len(taxi_ids), ' in this data')
-    empty_route = -1
-    trajectory_number = 1
-
-    completed_count = 0
-
-    for taxi_id in taxi_ids[:10]:
-        # get the df for that taxis
-        taxi_df = df.loc[df['taxi_id'] == taxi_id]
-        taxi_df.sort_values(by=['time'], inplace=True)
-        passenger_got_in = False
-        route_numbers = []
-        route_starts = []
-        route_ends = []
-
-        for index, row in taxi_df.iterrows():
-            passenger_in_taxi = row['occupancy_status']
-
-            # Do we already have a passenger?
-            if passenger_got_in:
-                if passenger_in_taxi:
-                    # trajectory still going
-                    route_starts.append(False)
-                    route_ends.append(False)
-                    route_numbers.append(trajectory_number)
-                    continue
-                elif not passenger_in_taxi:
-                    # trajectory ended
-                    passenger_got_in = False
-                    route_starts.append(False)
-                    route_ends.append(True)
-                    route_numbers.append(trajectory_number)
-                    trajectory_number += 1
-
-            elif passenger_in_taxi:
-                passenger_got_in = True
-                route_starts.append(True)
-                route_ends.append(False)
-                route_numbers.append(trajectory_number)
-
-            else:
-                route_starts.append(False)
-                route_ends.append(False)
-                route_numbers.append(empty_route)
-
-        taxi_df['route_number'] = route_numbers
-        taxi_df['route_start'] = route_starts
-        taxi_df['route_end'] = route_ends
-        updated_dfs.append(taxi_df)
-        completed_count += 1
-
-        if completed_count % 100 == 0:
-            print('Completed ', completed_count, ' taxi_ids out of ', len(taxi_ids))
-
-    return pd.concat(updated_dfs)
-
-
-
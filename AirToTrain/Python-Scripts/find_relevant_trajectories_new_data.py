@@ -1,5 +1,11 @@
 import pandas as pd
 import os
+from multiprocessing import Pool
+from segment_trajectories import segment_trajectories
+from stream_trajectories import read_csv_in_chunks, stream_trajectories
+from columnar_store import save_df_as_parquet, append_df_to_parquet_dataset, clear_parquet_dataset
+from regions import shenzhen_regions
+from route_summary import route_endpoints, classify_endpoints, find_routes_between
 
 ###########################################
 # Find Relevant Routes in the new dataset #
@@ -24,167 +30,19 @@ def load_csv_as_df(file_name, sub_directories, column_numbers=None, column_names
     return df
 
 
-def lookup(s):
-    """
-    This is an extremely fast approach to datetime parsing.
-    For large data, the same dates are often repeated. Rather than
-    re-parse these, we store all unique dates, parse them, and
-    use a lookup to convert all dates.
-    """
-    dates = {date: pd.to_datetime(date) for date in s.unique()}
-    return s.map(dates)
-
-
 def label_trajectories(df, trajectory_number):
-    """
-    This method didn't work very well! Not recommended (slow)
-    """
-
-    df['time'] = lookup(df['time'])  # add time for sorting
-    updated_dfs = []
-    taxi_ids = df['taxi_id'].unique()
-    print('There are ', len(taxi_ids), ' unique taxi ids in this data')
-
-    empty_route = -1
-    completed_count = 0
-
-    for taxi_id in taxi_ids:
-        # get the df for that taxi
-        taxi_df = df.loc[df['taxi_id'] == taxi_id]
-        taxi_df.sort_values(by=['time'], inplace=True)
-        passenger_got_in = False
-
-        route_numbers = []
-        route_starts = []
-        route_ends = []
-        relevant_starts = []
-        relevant_ends = []
-
-        airport_starts = []
-        airport_ends = []
-        train_starts = []
-        train_ends = []
-
-        for index, row in taxi_df.iterrows():
-            passenger_in_taxi = row['occupancy_status']
-
-            # Do we already have a passenger?
-            if passenger_got_in:
-                if passenger_in_taxi:
-                    # trajectory still going
-                    route_starts.append(False)
-                    route_ends.append(False)
-                    relevant_ends.append(False)
-                    relevant_starts.append(False)
-                    train_starts.append(False)
-                    airport_starts.append(False)
-                    train_ends.append(False)
-                    airport_ends.append(False)
-                    route_numbers.append(trajectory_number)
-                    continue
-                elif not passenger_in_taxi:
-                    # trajectory ended
-                    passenger_got_in = False
-                    route_starts.append(False)
-                    route_ends.append(True)
-                    route_numbers.append(trajectory_number)
-                    trajectory_number += 1
-
-                    # Is this relevant?
-                    end_lat = row['latitude']
-                    end_long = row['longitude']
-
-                    if near_airport(end_lat, end_long) or near_train_station(end_lat, end_long):
-                        relevant_ends.append(True)
-
-                        if near_airport(end_lat, end_long):
-                            airport_ends.append(True)
-                            train_ends.append(False)
-                        else:
-                            airport_ends.append(False)
-                            train_ends.append(True)
-
-                    else:
-                        relevant_ends.append(False)
-                        airport_ends.append(False)
-                        train_ends.append(False)
-
-                    relevant_starts.append(False)
-                    airport_starts.append(False)
-                    train_starts.append(False)
-
-            elif passenger_in_taxi:
-                # someone just got in
-                passenger_got_in = True
-                route_starts.append(True)
-                route_ends.append(False)
-                route_numbers.append(trajectory_number)
-                # is this relevant?
-
-                start_lat = row['latitude']
-                start_long = row['longitude']
-
-                if near_airport(start_lat, start_long) or near_train_station(start_lat, start_long):
-                    relevant_starts.append(True)
-
-                    if near_airport(start_lat, start_long):
-                        airport_starts.append(True)
-                        train_starts.append(False)
-                    else:
-                        train_starts.append(True)
-                        airport_starts.append(False)
-
-                else:
-                    relevant_starts.append(False)
-                    airport_starts.append(False)
-                    train_starts.append(False)
-
-                relevant_ends.append(False)
-                airport_ends.append(False)
-                train_ends.append(False)
-
-            else:
-                # driving around without no passenger
-                route_starts.append(False)
-                route_ends.append(False)
-                relevant_ends.append(False)
-                relevant_starts.append(False)
-                train_starts.append(False)
-                airport_starts.append(False)
-                train_ends.append(False)
-                airport_ends.append(False)
-                route_numbers.append(empty_route)
-
-        taxi_df['route_number'] = route_numbers
-        taxi_df['route_start'] = route_starts
-        taxi_df['route_end'] = route_ends
-        taxi_df['relevant_start'] = relevant_starts
-        taxi_df['relevant_end'] = relevant_ends
-        taxi_df['airport_start'] = airport_starts
-        taxi_df['airport_end'] = airport_ends
-        taxi_df['train_start'] = train_starts
-        taxi_df['train_end'] = train_ends
-
-        taxi_df = taxi_df[taxi_df.route_number != -1]
-        updated_dfs.append(taxi_df)
-        completed_count += 1
-
-        if completed_count % 500 == 0:
-            print('Completed ', completed_count, ' taxi_ids out of ', len(taxi_ids))
+    df, trajectory_number = segment_trajectories(df, trajectory_number, station_flags=True)
+    df = df[df.route_number != -1]
 
     print('Done mapping trajectories!')
-    return pd.concat(updated_dfs), trajectory_number
+    return df, trajectory_number
 
 
 def find_trajectories_at_airport_or_bus(df):
-    # Test this method!
-    air_to_bus_df = df[(df['airport_start'] == True) & (df['train_end'] == True)]
-    bus_to_air_df = df[(df['train_start'] == True) & (df['airport_end'] == True)]
+    endpoints = classify_endpoints(route_endpoints(df))
 
-    relevant_air_to_bus_numbers = air_to_bus_df.route_number.unique()
-    relevant_bus_to_air_numbers = bus_to_air_df.route_number.unique()
-
-    route_numbers = relevant_air_to_bus_numbers + relevant_bus_to_air_numbers
+    route_numbers = find_routes_between(endpoints, 'airport', 'north_train_station')
+    route_numbers += find_routes_between(endpoints, 'north_train_station', 'airport')
 
     print('Found ', len(route_numbers), ' relevant routes!')
 
@@ -195,24 +53,15 @@ def find_trajectories_at_airport_or_bus(df):
 
 
 def near_airport(lat, long):
-    if 22.605770 <= lat <= 22.667089 and 113.784647 <= long <= 113.837340:
-        return True
-    else:
-        return False
+    return shenzhen_regions.contains('airport', lat, long)
 
 
 def near_bus_station(lat, long):
-    if 22.567210 <= lat <= 22.568807 and 114.089676 <= long <= 114.091320:
-        return True
-    else:
-        return False
+    return shenzhen_regions.contains('bus_station', lat, long)
 
 
 def near_train_station(lat, long):
-    if 22.604998 <= lat <= 22.614221 and 114.021111 <= long <= 114.034778:
-        return True
-    else:
-        return False
+    return shenzhen_regions.contains('north_train_station', lat, long)
 
 
 def load_data_and_find_relevant_routes(file_name, sub_directories, trajectory_number):
@@ -222,13 +71,13 @@ def load_data_and_find_relevant_routes(file_name, sub_directories, trajectory_nu
     df = load_csv_as_df(file_name, sub_directories, col_numbers, col_names)
     df, new_trajectory_number = label_trajectories(df, trajectory_number)
 
-    labeled_file_name = file_name + '-With-Trajectories.csv'
-    df.to_csv(labeled_file_name, encoding='utf-8')
+    labeled_file_name = file_name + '-With-Trajectories.parquet'
+    save_df_as_parquet(df, labeled_file_name)
 
     relevant_df = find_trajectories_at_airport_or_bus(df)
-    csv_file_name = file_name + '.csv'
+    relevant_file_name = file_name + '.parquet'
 
-    relevant_df.to_csv(csv_file_name, encoding='utf-8')
+    save_df_as_parquet(relevant_df, relevant_file_name)
 
     with open('RouteNumbers.txt', 'w') as f:
         f.write('%d' % new_trajectory_number)
@@ -241,20 +90,66 @@ def load_data_and_find_relevant_routes(file_name, sub_directories, trajectory_nu
     return relevant_df, new_trajectory_number
 
 
-def load_all_data_from(folder_name, number_of_files):
+def part_file_name(i):
+    return 'part-m-' + str(i).zfill(5)
+
+
+def label_part_file(file_name, sub_directories):
+    """
+    Process pool worker. Labels one part file on its own with route numbers starting at 1.
+    :return: (relevant data-frame, number of routes that ended in this file)
+    """
+    col_numbers = [3, 4, 5, 6, 7, 8, 12]
+    col_names = ['longitude', 'latitude', 'time', 'taxi_id', 'speed', 'direction', 'occupancy_status']
+
+    df = load_csv_as_df(file_name, sub_directories, col_numbers, col_names)
+    df, new_trajectory_number = label_trajectories(df, 1)
+    relevant_df = find_trajectories_at_airport_or_bus(df)
+
+    print('Found ', len(relevant_df), ' relevant routes in ', file_name)
+    return relevant_df, new_trajectory_number - 1
+
+
+def load_all_data_in_parallel(folder_name, number_of_files, processes=None):
+    """
+    Label every part file at the same time, then shift each file's local route numbers by the number of routes
+    that ended in the files before it. A route number only depends on the routes ended before it, so the
+    result is the same as threading trajectory_number through a sequential run.
+    The per file -With-Trajectories.parquet dump is skipped in this mode.
+    :param processes: number of worker processes (defaults to the number of cores)
+    :return: list of relevant data-frames in file order
+    """
+    file_names = [part_file_name(i) for i in range(0, number_of_files)]
+
+    with Pool(processes) as pool:
+        results = pool.starmap(label_part_file, [(file_name, folder_name) for file_name in file_names])
+
     trajectory_number = 1
-    base_file_name = 'part-m-'
     relevant_dfs = []
 
-    for i in range(0, number_of_files):
-    # for i in range(0, number_of_files):
+    for file_name, (relevant_df, route_count) in zip(file_names, results):
+        relevant_df = relevant_df.assign(route_number=relevant_df['route_number'] + (trajectory_number - 1))
+        save_df_as_parquet(relevant_df, file_name + '.parquet')
+
+        relevant_dfs.append(relevant_df)
+        trajectory_number += route_count
+
+    with open('RouteNumbers.txt', 'w') as f:
+        f.write('%d' % trajectory_number)
+
+    print('new_trajectory_number: ', trajectory_number)
+    return relevant_dfs
 
-        if i < 10:
-            file_number = '0000' + str(i)
-        else:
-            file_number = '000' + str(i)
 
-        file_name = base_file_name + file_number
+def load_all_data_from(folder_name, number_of_files, parallel=False, processes=None):
+    if parallel:
+        return load_all_data_in_parallel(folder_name, number_of_files, processes)
+
+    trajectory_number = 1
+    relevant_dfs = []
+
+    for i in range(0, number_of_files):
+        file_name = part_file_name(i)
         df, new_trajectory_number = load_data_and_find_relevant_routes(file_name, folder_name, trajectory_number)
 
         relevant_dfs.append(df)
@@ -265,7 +160,35 @@ def load_all_data_from(folder_name, number_of_files):
     return relevant_dfs
 
 
-all_relevant_df_list = load_all_data_from('/2014-04-06/', 76)
+def stream_all_data_from(folder_name, number_of_files, chunk_size=1000000, dataset_name='RelevantTrajectories.parquet'):
+    """
+    Streaming version of load_all_data_from. Part files are read chunk_size rows at a time and relevant routes are
+    added to the dataset_name parquet directory as soon as they end, so nothing grows with the number of files.
+    The directory is cleared first, parts of an earlier run are not kept.
+    Each taxi's readings have to be in time order across the part files, see stream_trajectories.
+    :return: number of relevant readings written
+    """
+    col_numbers = [3, 4, 5, 6, 7, 8, 12]
+    col_names = ['longitude', 'latitude', 'time', 'taxi_id', 'speed', 'direction', 'occupancy_status']
+    file_names = [part_file_name(i) for i in range(0, number_of_files)]
+
+    chunks = read_csv_in_chunks(file_names, folder_name, chunk_size, col_numbers, col_names)
+    written = 0
+    clear_parquet_dataset(dataset_name)
+
+    for part_number, routes_df in enumerate(stream_trajectories(chunks, station_flags=True)):
+        relevant_df = find_trajectories_at_airport_or_bus(routes_df)
+
+        if len(relevant_df):
+            append_df_to_parquet_dataset(relevant_df, dataset_name, part_number)
+            written += len(relevant_df)
+
+    print('Wrote ', written, ' relevant readings to ', dataset_name)
+    return written
+
+
+if __name__ == '__main__':
+    all_relevant_df_list = load_all_data_from('/2014-04-06/', 76, parallel=True)
 
-dfs = pd.concat(all_relevant_df_list)
-dfs.to_csv('RelevantTrajectories.csv', encoding='utf-8')
+    dfs = pd.concat(all_relevant_df_list)
+    save_df_as_parquet(dfs, 'RelevantTrajectories.parquet')
@@ -1,6 +1,12 @@
 import pandas as pd
 import os
-import mpu
+from time_parsing import parse_gps_times
+from trajectory_index import TrajectoryIndex
+from route_distances import haversine_km, route_segment_distances
+from route_features import route_feature_table
+from route_filters import filter_routes, default_quality_rules
+from grid_cells import default_cell_grid, map_gps_to_cell_ids, no_cell
+from regions import shenzhen_regions
 
 """
 I used this file in combination with the Jupyter Notebook Find Train to Train Routes to locate routes between the north
@@ -41,32 +47,27 @@ def filter_data_by_gps(df, min_lat, max_lat, min_long, max_long, with_pass=False
         return near_lat_and_long
 
 
-# Shenzhen Train station west GPS 22.5316,113.903
-df = pd.DataFrame()
-train_station_west_gps = (22.5316, 113.903)
-lat_diff = 0.025
-long_diff = 0.025
+def filter_data_by_region(df, region_name, with_pass=False, registry=shenzhen_regions):
+    """
+    filter_data_by_gps over the bounding box of a region in regions.json.
+    """
+    min_lat, max_lat, min_long, max_long = registry.boxes[registry.region_id(region_name)]
+    return filter_data_by_gps(df, min_lat, max_lat, min_long, max_long, with_pass)
 
-near_west_train_df = filter_data_by_gps(df,
-                                        train_station_west_gps[0] - lat_diff,
-                                        train_station_west_gps[0] + lat_diff,
-                                        train_station_west_gps[1] - long_diff,
-                                        train_station_west_gps[1] + long_diff,
-                                        with_pass=True)
 
+df = pd.DataFrame(columns=['taxi_id', 'latitude', 'longitude', 'occupancy_status'])
 
-train_station_north_gps_min = (22.605502, 114.023724)
-train_station_north_gps_max = (22.613580, 114.034568)
+near_west_train_df = filter_data_by_region(df, 'west_train_station', with_pass=True)
+near_north_train_df = filter_data_by_region(df, 'north_train_station_core', with_pass=True)
 
-near_north_train_df = filter_data_by_gps(df,
-                                         train_station_north_gps_min[0],
-                                         train_station_north_gps_max[0],
-                                         train_station_north_gps_min[1],
-                                         train_station_north_gps_max[1],
-                                         with_pass=True)
 
+def get_gps_records_with_taxi_id_in(taxi_id_list, df, index=None):
+    """
+    :param index: TrajectoryIndex of df, slices each taxi instead of scanning df
+    """
+    if index is not None:
+        return index.taxis(taxi_id_list)
 
-def get_gps_records_with_taxi_id_in(taxi_id_list, df):
     return df[df['taxi_id'].isin(taxi_id_list)]
 
 
@@ -109,48 +110,22 @@ def load_google_map_dfs():
     return dfs
 
 
-def concat(row, col):
-    return str(row) + '-' + str(col)
-
-
-def map_gps_to_box(latitude, longitude):
-    row_number = int((latitude - min_lat) // cell_size)
-    col_number = int((longitude - min_long) // cell_size)
-
-    if col_number < 0 or row_number < 0:
+def map_gps_to_box(latitude, longitude, grid=default_cell_grid):
+    rows, columns = grid.rows_and_columns([latitude], [longitude])
+    if rows[0] == no_cell:
         return -1, -1, -1
 
-    cell_number_str = str(row_number) + str(col_number)
-
-    return concat(row_number, col_number), row_number, col_number
-
+    return grid.cell_labels(grid.cell_ids([latitude], [longitude]))[0], int(rows[0]), int(columns[0])
 
-def map_gps_to_cell(df):
-    cells = []
-    rows = []
-    cols = []
 
-    for index, row in df.iterrows():
-        lat = row['latitude']
-        long = row['longitude']
-
-        cell_number, cell_row, cell_col = map_gps_to_box(lat, long)
-
-        cells.append(cell_number)
-        cols.append(cell_col)
-        rows.append(cell_row)
-
-    df['cell'] = cells
-    df['row'] = rows
-    df['column'] = cols
-
-    return df
+def map_gps_to_cell(df, grid=default_cell_grid, labels=False):
+    return map_gps_to_cell_ids(df, grid, labels)
 
 
 def map_google_maps_routes_to_cells(df_list):
     with_cells = []
     for df in df_list:
-        df = map_gps_to_cell(df)
+        df = map_gps_to_cell(df, labels=True)
         with_cells.append(df)
     return with_cells
 
@@ -203,119 +178,51 @@ def graph_all_routes_against_google_maps(df, google_maps_dfs, north_to_west=True
 # graph_all_routes_against_google_maps(air_df, [bottom_df, middle_air_train_df, top_df], north_to_west=True)
 
 
-def find_routes_with_ten_readings(df, route_numbers, min_num_readings=10, verbose=False):
-    routes = []
+def find_routes_with_ten_readings(df, route_numbers, min_num_readings=10, verbose=False, index=None):
+    if index is None:
+        index = TrajectoryIndex(df)
 
-    for number in route_numbers:
-        route_df = df[df['route_number'] == number]
+    lengths = index.route_lengths().reindex(route_numbers, fill_value=0)
 
-        if len(route_df) >= min_num_readings:
-            routes.append(route_df)
-        elif verbose:
-            print('Route: ', number, ' only has ', len(route_df), ' readings!')
+    if verbose:
+        for number, count in lengths[lengths < min_num_readings].items():
+            print('Route: ', number, ' only has ', count, ' readings!')
 
-    print('Found', len(routes), 'routes that have', min_num_readings, 'or more readings')
+    long_route_numbers = lengths.index[lengths >= min_num_readings]
+    print('Found', len(long_route_numbers), 'routes that have', min_num_readings, 'or more readings')
 
-    return pd.concat(routes)
-
-
-def lookup(s):
-    """
-    This is an extremely fast approach to datetime parsing.
-    For large data, the same dates are often repeated. Rather than
-    re-parse these, we store all unique dates, parse them, and
-    use a lookup to convert all dates.
-    """
-    dates = {date: pd.to_datetime(date) for date in s.unique()}
-    return s.map(dates)
+    return index.routes(long_route_numbers)
 
 
 def remove_routes_with_corrupt_start_end_times_and_calc_duration(df):
-    route_durations = {}
-    proper_route_numbers = []
+    df['time'] = parse_gps_times(df['time'])
+    time_rules = [rule for rule in default_quality_rules if rule[0] in ('missing_start_or_end', 'end_not_after_start')]
+    kept, _ = filter_routes(route_feature_table(df), time_rules)
 
-    df['time'] = lookup(df['time'])
-    route_ids = df['route_number'].unique()
-
-    for route_id in route_ids:
-        route_df = df[df['route_number'] == route_id]
-
-        start_row = route_df[route_df['route_start'] == True]
-        end_row = route_df[route_df['route_end'] == True]
-
-        has_start_and_end = True
-        if len(start_row) == 0:
-            print('No start for route: ', route_id)
-            has_start_and_end = False
-
-        if len(end_row) == 0:
-            print('No end for route: ', route_id)
-            has_start_and_end = False
-
-        if has_start_and_end:
-            start_time = start_row['time'].iloc[0]
-            end_time = end_row['time'].iloc[0]
-
-            if start_time < end_time:
-                route_duration = end_time - start_time
-                duration_in_seconds = route_duration.total_seconds()
-                route_durations[route_id] = duration_in_seconds
-                proper_route_numbers.append(route_id)
-
-    duration_df = pd.DataFrame(list(route_durations.items()), columns=['route_number', 'duration_in_seconds'])
-    return duration_df, df[df['route_number'].isin(proper_route_numbers)]
+    duration_df = kept['duration_in_seconds'].reset_index()
+    return duration_df, df[df['route_number'].isin(kept.index)]
 
 
 def find_fraud_routes_by_time_distance(df, avg_time, avg_distance):
+    """
+    Fixed cutoffs. quantile_sketches.find_fraud_routes_by_percentile derives them per OD pair instead.
+    """
     return df[(df['distance_in_km'] >= avg_distance) & (df['duration_in_seconds'] >= avg_time)]
 
 
 def distance_between_gps(gps_one, gps_two):
-    # mpu.haversine_distance((lat1, lon1), (lat2, lon2))
-    km_distance = mpu.haversine_distance((gps_one[0], gps_one[1]), (gps_two[0], gps_two[1]))
+    return float(haversine_km(gps_one[0], gps_one[1], gps_two[0], gps_two[1]))
 
-    if km_distance < 0:
-        print('got negative distance that\'s weak')
-        km_distance *= -1
 
-    return km_distance
+def remove_routes_with_excessive_distances(df, max_distance_km=100):
+    df['time'] = parse_gps_times(df['time'])
+    _, route_distances = route_segment_distances(df)
 
+    excessive = route_distances[route_distances >= max_distance_km]
+    for route_id, distance_sum in excessive.items():
+        print('Route ', route_id, ' has excessive distance: ', distance_sum)
 
-def remove_routes_with_excessive_distances(df):
-    proper_route_numbers = []
-    df['time'] = lookup(df['time'])
-    route_ids = df['route_number'].unique()
-
-    for route_id in route_ids:
-        route_df = df[df['route_number'] == route_id]
-        route_df.sort_values('time')
-        route_df.reset_index(drop=True)
-
-        distance_sum = 0.0
-        is_first_row = True
-
-        for index, row in route_df.iterrows():
-            if not is_first_row:
-                last_row = route_df.loc[index - 1]
-                last_lat = last_row['latitude']
-                last_long = last_row['longitude']
-                last_gps = (last_lat, last_long)
-
-                current_lat = row['latitude']
-                current_long = row['longitude']
-                current_gps = (current_lat, current_long)
-
-                distance_between_rows = distance_between_gps(last_gps, current_gps)
-                distance_sum += distance_between_rows
-            else:
-                is_first_row = False
-
-        if distance_sum < 100:
-            proper_route_numbers.append(route_id)
-        else:
-            print('Route ', route_id, ' has excessive distance: ', distance_sum)
-
-    return df[df['route_number'].isin(proper_route_numbers)]
+    return df[df['route_number'].isin(route_distances.index[route_distances < max_distance_km])]
 
 
 def get_suspected_fraud_by_time_distance(df, text_file_name):
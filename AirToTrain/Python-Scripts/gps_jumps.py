@@ -0,0 +1,173 @@
+import pandas as pd
+import numpy as np
+from time_parsing import parse_gps_times, to_epoch_seconds
+from segment_trajectories import sort_by_taxi_and_time
+from route_distances import haversine_km
+
+##############################################################
+# Find single GPS fixes that jump away from their neighbours #
+##############################################################
+
+
+def implied_speeds(lat, long, times, taxi_codes):
+    """
+    Speed needed to reach each fix from the previous fix of the same taxi.
+    :return: km/h array, NaN for the first fix of each taxi; readings with the same timestamp count as 1 second apart
+    """
+    speeds = np.full(len(lat), np.nan)
+    if len(lat) > 1:
+        same_taxi = taxi_codes[1:] == taxi_codes[:-1]
+        gaps = np.maximum(times[1:] - times[:-1], 1)
+        distances = haversine_km(lat[:-1], long[:-1], lat[1:], long[1:])
+        speeds[1:] = np.where(same_taxi, distances / gaps * 3600, np.nan)
+
+    return speeds
+
+
+def find_jumps(lat, long, times, taxi_codes, reported_speeds, max_speed_kmh, speed_tolerance_kmh, max_run_length):
+    """
+    A move between two fixes is impossible when it implies more than max_speed_kmh and neither fix's own speed
+    reading backs it up. The fixes between two impossible moves (at most max_run_length of them) jumped away and
+    came back. At the ends of a taxi's readings, a run on the far side of one impossible move is a jump when it is
+    shorter than the run it jumped from.
+    :return: boolean array
+    """
+    speeds = implied_speeds(lat, long, times, taxi_codes)
+    impossible = np.nan_to_num(speeds, nan=-1) > max_speed_kmh
+
+    if reported_speeds is not None and len(lat) > 1:
+        backed_up = np.r_[np.inf, np.fmax(reported_speeds[1:], reported_speeds[:-1])] + speed_tolerance_kmh
+        impossible &= ~(speeds <= backed_up)
+
+    # runs of fixes split at taxi changes and impossible moves
+    new_run = impossible | np.isnan(speeds)
+    run_ids = np.cumsum(new_run) - 1
+    run_starts = np.flatnonzero(new_run)
+    run_lengths = np.diff(np.r_[run_starts, len(lat)])
+
+    starts_with_jump = impossible[run_starts]
+    ends_with_jump = np.r_[starts_with_jump[1:], False]
+    previous_lengths = np.r_[0, run_lengths[:-1]]
+    next_lengths = np.r_[run_lengths[1:], 0]
+
+    bad_runs = run_lengths <= max_run_length
+    bad_runs &= (starts_with_jump & ends_with_jump) | \
+                (starts_with_jump & ~ends_with_jump & (run_lengths < previous_lengths)) | \
+                (~starts_with_jump & ends_with_jump & (run_lengths < next_lengths))
+
+    return bad_runs[run_ids]
+
+
+def repair_jumps(lat, long, times, taxi_codes, jumps):
+    """
+    Move every jump onto the straight line between the nearest good fixes of the same taxi, by time. Jumps with a
+    good fix on one side only take its position; jumps with none are left for the caller to drop.
+    :return: (lat, long, repaired mask)
+    """
+    good = np.flatnonzero(~jumps)
+    bad = np.flatnonzero(jumps)
+    lat, long = lat.copy(), long.copy()
+
+    after = np.searchsorted(good, bad)
+    before = after - 1
+    has_before = before >= 0
+    has_before[has_before] = taxi_codes[good[before[has_before]]] == taxi_codes[bad[has_before]]
+    has_after = after < len(good)
+    has_after[has_after] = taxi_codes[good[after[has_after]]] == taxi_codes[bad[has_after]]
+
+    previous = good[np.clip(before, 0, max(len(good) - 1, 0))] if len(good) else bad
+    following = good[np.clip(after, 0, max(len(good) - 1, 0))] if len(good) else bad
+    previous = np.where(has_before, previous, following)
+    following = np.where(has_after, following, previous)
+
+    span = (times[following] - times[previous]).astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = np.where(span > 0, (times[bad] - times[previous]) / span, 0.0)
+
+    repaired = has_before | has_after
+    fixed = bad[repaired]
+    lat[fixed] = (lat[previous] + weight * (lat[following] - lat[previous]))[repaired]
+    long[fixed] = (long[previous] + weight * (long[following] - long[previous]))[repaired]
+
+    repaired_mask = np.zeros(len(lat), dtype=bool)
+    repaired_mask[fixed] = True
+
+    return lat, long, repaired_mask
+
+
+def move_endpoint_flags(df, taxi_codes, dropped):
+    """
+    Hand the route_start flag of a dropped reading to the next kept reading of the same route, and the route_end
+    flag to the previous one, so cleaning a route's first or last fix doesn't cost it its duration.
+    :param df: labeled data-frame sorted by taxi and time
+    :param dropped: mask of the readings about to be dropped
+    :return: df with the flags moved
+    """
+    kept = np.flatnonzero(~dropped)
+    route_numbers = df['route_number'].to_numpy()
+    flags = {}
+
+    for col, step in [('route_start', 0), ('route_end', -1)]:
+        values = df[col].to_numpy(dtype=bool).copy()
+        lost = np.flatnonzero(dropped & values)
+
+        # next kept reading for a start, previous one for an end
+        neighbours = np.searchsorted(kept, lost) + step
+        valid = (neighbours >= 0) & (neighbours < len(kept))
+        lost, neighbours = lost[valid], kept[neighbours[valid]]
+
+        same_route = (taxi_codes[neighbours] == taxi_codes[lost]) & (route_numbers[neighbours] == route_numbers[lost])
+        values[neighbours[same_route]] = True
+        values[lost] = False
+        flags[col] = values
+
+    return df.assign(**flags)
+
+
+def remove_gps_jumps(df, max_speed_kmh=150, speed_tolerance_kmh=30, max_run_length=3, repair=False, max_passes=3):
+    """
+    Catch corrupt fixes one at a time instead of dropping whole routes over their total distance.
+    Each pass compares every fix with its current neighbours, so jumps hidden behind other jumps are caught on later
+    passes.
+    :param df: raw or labeled GPS data-frame, speed column (km/h) used for the cross check when present
+    :param max_speed_kmh: fastest believable speed between two fixes
+    :param speed_tolerance_kmh: how far above the reported speed the implied speed may be
+    :param max_run_length: longest run of consecutive fixes treated as one jump
+    :param repair: interpolate jumps from their neighbours instead of dropping them
+    :return: (data-frame sorted by taxi and time without (or with repaired) jumps, data-frame of the jumps found).
+             On labeled data the route_start / route_end flag of a dropped reading moves to the nearest kept
+             reading of the same route.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(df['time']):
+        df = df.assign(time=parse_gps_times(df['time']))
+
+    df, taxi_codes = sort_by_taxi_and_time(df)
+    lat = df['latitude'].to_numpy(dtype=float)
+    long = df['longitude'].to_numpy(dtype=float)
+    times = to_epoch_seconds(df['time'])
+    reported_speeds = df['speed'].to_numpy(dtype=float) if 'speed' in df.columns else None
+
+    jumps = np.zeros(len(df), dtype=bool)
+    for _ in range(max_passes):
+        remaining = np.flatnonzero(~jumps)
+        new_jumps = find_jumps(lat[remaining], long[remaining], times[remaining], taxi_codes[remaining],
+                               None if reported_speeds is None else reported_speeds[remaining],
+                               max_speed_kmh, speed_tolerance_kmh, max_run_length)
+        if not new_jumps.any():
+            break
+
+        jumps[remaining[new_jumps]] = True
+
+    jump_df = df[jumps]
+    print('Found ', len(jump_df), ' GPS jumps in ', len(df), ' readings')
+
+    dropped = jumps
+    if repair:
+        lat, long, repaired = repair_jumps(lat, long, times, taxi_codes, jumps)
+        df = df.assign(latitude=lat.astype(df['latitude'].dtype), longitude=long.astype(df['longitude'].dtype))
+        dropped = jumps & ~repaired
+
+    if 'route_start' in df.columns and 'route_number' in df.columns:
+        df = move_endpoint_flags(df, taxi_codes, dropped)
+
+    return df[~dropped], jump_df
@@ -0,0 +1,178 @@
+import pandas as pd
+import numpy as np
+
+##############################################################
+# Integer grid cells for GPS readings, labels only on demand #
+##############################################################
+
+no_cell = -1
+
+
+class CellGrid(object):
+    """
+    Square cells of cell_size degrees counted from (min_lat, min_long). A cell id is row * columns + column, so ids
+    are plain integers and the 'row-col' strings of the old *-with-cells.csv files are only made for display.
+    """
+
+    def __init__(self, min_lat=22.0, min_long=113.0, cell_size=0.05, max_lat=23.0, max_long=115.0):
+        self.min_lat = min_lat
+        self.min_long = min_long
+        self.cell_size = cell_size
+        self.max_lat = max_lat
+        self.max_long = max_long
+        self.rows = int(np.ceil((max_lat - min_lat) / cell_size))
+        self.columns = int(np.ceil((max_long - min_long) / cell_size))
+
+    def rows_and_columns(self, lat, long):
+        """
+        :return: (row, column) int arrays, no_cell for points outside the grid or without coordinates
+        """
+        with np.errstate(invalid='ignore'):
+            rows = np.floor((np.asarray(lat, dtype=float) - self.min_lat) / self.cell_size)
+            columns = np.floor((np.asarray(long, dtype=float) - self.min_long) / self.cell_size)
+
+        outside = ~((rows >= 0) & (rows < self.rows) & (columns >= 0) & (columns < self.columns))
+        rows = np.where(outside, no_cell, np.nan_to_num(rows)).astype(np.int64)
+        columns = np.where(outside, no_cell, np.nan_to_num(columns)).astype(np.int64)
+
+        return rows, columns
+
+    def cell_ids(self, lat, long):
+        rows, columns = self.rows_and_columns(lat, long)
+        return np.where(rows == no_cell, no_cell, rows * self.columns + columns)
+
+    def cell_labels(self, cell_ids):
+        """
+        'row-col' label of every cell id, formatted once per distinct cell.
+        """
+        unique_ids, positions = np.unique(np.asarray(cell_ids), return_inverse=True)
+        labels = np.array([str(cell // self.columns) + '-' + str(cell % self.columns) if cell != no_cell
+                           else str(no_cell) for cell in unique_ids], dtype=object)
+
+        return labels[positions.ravel()]
+
+
+# the 20 rows per degree grid of the *-with-cells.csv files
+default_cell_grid = CellGrid()
+
+
+def map_gps_to_cell_ids(df, grid=default_cell_grid, labels=False):
+    """
+    Add cell_id, row and column to every reading in one vectorized pass.
+    :param labels: also add the 'row-col' cell strings, for display or the old csv layout
+    """
+    rows, columns = grid.rows_and_columns(df['latitude'].to_numpy(dtype=float), df['longitude'].to_numpy(dtype=float))
+    cell_ids = np.where(rows == no_cell, no_cell, rows * grid.columns + columns)
+    df = df.assign(cell_id=cell_ids.astype(np.int32), row=rows.astype(np.int32), column=columns.astype(np.int32))
+
+    if labels:
+        df['cell'] = pd.Categorical(grid.cell_labels(cell_ids))
+
+    return df
+
+
+def spread_bits(values):
+    """
+    Put a zero bit between each of the lower 16 bits: abcd -> 0a0b0c0d.
+    """
+    values = values.astype(np.uint64) & np.uint64(0x0000FFFF)
+    values = (values | (values << np.uint64(8))) & np.uint64(0x00FF00FF)
+    values = (values | (values << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+    values = (values | (values << np.uint64(2))) & np.uint64(0x33333333)
+    values = (values | (values << np.uint64(1))) & np.uint64(0x55555555)
+
+    return values
+
+
+def compact_bits(values):
+    values = values.astype(np.uint64) & np.uint64(0x55555555)
+    values = (values | (values >> np.uint64(1))) & np.uint64(0x33333333)
+    values = (values | (values >> np.uint64(2))) & np.uint64(0x0F0F0F0F)
+    values = (values | (values >> np.uint64(4))) & np.uint64(0x00FF00FF)
+    values = (values | (values >> np.uint64(8))) & np.uint64(0x0000FFFF)
+
+    return values.astype(np.int64)
+
+
+class MortonGrid(object):
+    """
+    Quadtree over a square area: level 0 is one cell, every level splits each cell in four, and a reading's
+    Morton code at the finest level interleaves its row and column bits. The code at any coarser level is the fine
+    code shifted right by two bits per level, so the cell-similarity methods can sweep resolutions from one stored
+    column without mapping the readings again.
+    """
+
+    def __init__(self, min_lat=22.0, min_long=113.0, size=2.0, levels=16):
+        """
+        :param size: side of the square area in degrees
+        :param levels: finest level, at most 16 so a code fits in 32 bits
+        """
+        self.min_lat = min_lat
+        self.min_long = min_long
+        self.size = size
+        self.levels = levels
+        self.no_code = np.uint32(0xFFFFFFFF)
+
+    def cell_size(self, level):
+        return self.size / (1 << level)
+
+    def codes(self, lat, long):
+        """
+        :return: uint32 finest level codes, no_code for points outside the area
+        """
+        side = 1 << self.levels
+        with np.errstate(invalid='ignore'):
+            rows = np.floor((np.asarray(lat, dtype=float) - self.min_lat) / self.cell_size(self.levels))
+            columns = np.floor((np.asarray(long, dtype=float) - self.min_long) / self.cell_size(self.levels))
+
+        inside = (rows >= 0) & (rows < side) & (columns >= 0) & (columns < side)
+        rows = np.where(inside, rows, 0).astype(np.int64)
+        columns = np.where(inside, columns, 0).astype(np.int64)
+
+        codes = (spread_bits(rows) << np.uint64(1)) | spread_bits(columns)
+        return np.where(inside, codes, self.no_code).astype(np.uint32)
+
+    def coarsen(self, codes, level):
+        """
+        Codes of the same points at a coarser level, no_code stays no_code.
+        """
+        codes = np.asarray(codes, dtype=np.uint32)
+        shift = np.uint32(2 * (self.levels - level))
+
+        return np.where(codes == self.no_code, self.no_code, codes >> shift).astype(np.uint32)
+
+    def rows_and_columns(self, codes, level):
+        """
+        :param codes: codes at level (already coarsened)
+        :return: (row, column) int arrays at that level, no_cell for no_code
+        """
+        codes = np.asarray(codes, dtype=np.uint32)
+        missing = codes == self.no_code
+
+        rows = np.where(missing, no_cell, compact_bits(codes.astype(np.uint64) >> np.uint64(1)))
+        columns = np.where(missing, no_cell, compact_bits(codes))
+
+        return rows, columns
+
+    def cell_labels(self, codes, level):
+        rows, columns = self.rows_and_columns(codes, level)
+        return np.array([str(row) + '-' + str(column) if row != no_cell else str(no_cell)
+                         for row, column in zip(rows, columns)], dtype=object)
+
+
+default_morton_grid = MortonGrid()
+
+
+def add_morton_codes(df, grid=default_morton_grid):
+    """
+    Store the finest level code with every reading once, as a morton_code column.
+    """
+    return df.assign(morton_code=grid.codes(df['latitude'].to_numpy(dtype=float),
+                                            df['longitude'].to_numpy(dtype=float)))
+
+
+def cells_at_level(df, level, grid=default_morton_grid):
+    """
+    Cell codes at level from the stored morton_code column, no re-mapping of the coordinates.
+    """
+    return pd.Series(grid.coarsen(df['morton_code'].to_numpy(), level), index=df.index, name='cell_' + str(level))
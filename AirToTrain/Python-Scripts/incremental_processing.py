@@ -0,0 +1,193 @@
+import os
+import json
+import hashlib
+import pandas as pd
+from multiprocessing import Pool
+from regions import shenzhen_regions
+from route_summary import route_endpoints, classify_endpoints
+from route_features import route_feature_table
+from od_matrix import od_count_matrix
+from quantile_sketches import ODBaselines, load_od_baselines
+from transition_model import CellTransitionModel, load_transition_model
+from columnar_store import save_df_as_parquet, load_parquet_as_df
+from find_relevant_trajectories_new_data import load_csv_as_df, label_trajectories, \
+    find_trajectories_at_airport_or_bus, part_file_name
+
+###########################################################################
+# Only relabel part files that changed since the cached results were made #
+###########################################################################
+
+# bump whenever labeling, relevance or the feature table change so every cached file is redone
+stage_version = 3
+
+col_numbers = [3, 4, 5, 6, 7, 8, 12]
+col_names = ['longitude', 'latitude', 'time', 'taxi_id', 'speed', 'direction', 'occupancy_status']
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha1()
+
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+class ReprocessingManifest(object):
+    """
+    JSON record of every processed part file: content hash, stage version, route count and where its cached
+    outputs are. File size and modification time are kept too so unchanged files aren't hashed again.
+    """
+
+    def __init__(self, manifest_file='Manifest.json', cache_directory='/Cache/'):
+        self.manifest_file = manifest_file
+        self.cache_directory = cache_directory
+        self.entries = {}
+
+        if os.path.isfile(manifest_file):
+            with open(manifest_file) as f:
+                self.entries = json.load(f)
+
+        os.makedirs(os.getcwd() + cache_directory, exist_ok=True)
+
+    def current_hash(self, path):
+        stat = os.stat(path)
+        entry = self.entries.get(path)
+
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return entry['hash']
+
+        return file_hash(path)
+
+    def is_current(self, path, digest):
+        entry = self.entries.get(path)
+        return entry is not None and entry['hash'] == digest and entry['stage_version'] == stage_version
+
+    def record(self, path, digest, cache_name, route_count):
+        stat = os.stat(path)
+        self.entries[path] = {'hash': digest, 'size': stat.st_size, 'mtime': stat.st_mtime,
+                              'stage_version': stage_version, 'cache_name': cache_name, 'route_count': route_count}
+
+    def save(self):
+        with open(self.manifest_file, 'w') as f:
+            json.dump(self.entries, f, indent=2)
+
+
+def process_part_file(file_name, sub_directories, cache_directory, cache_name):
+    """
+    Process pool worker. Labels one part file with route numbers starting at 1 and caches the relevant readings,
+    their route feature table, the file's origin-destination counts, duration and distance sketches and cell
+    transition counts.
+    :return: number of routes that ended in this file
+    """
+    df = load_csv_as_df(file_name, sub_directories, col_numbers, col_names)
+    df, new_trajectory_number = label_trajectories(df, 1)
+
+    od_counts = od_count_matrix(classify_endpoints(route_endpoints(df)), shenzhen_regions)
+    relevant_df = find_trajectories_at_airport_or_bus(df)
+
+    save_df_as_parquet(relevant_df, cache_name + '-relevant.parquet', cache_directory)
+    features = route_feature_table(relevant_df)
+    save_df_as_parquet(features.reset_index(), cache_name + '-features.parquet', cache_directory)
+    ODBaselines().update(features).save(os.getcwd() + cache_directory + cache_name + '-baselines.json')
+    CellTransitionModel().update(relevant_df, features).save(os.getcwd() + cache_directory + cache_name +
+                                                             '-transitions.npz')
+    od_counts.to_csv(os.getcwd() + cache_directory + cache_name + '-od.csv', encoding='utf-8')
+
+    return new_trajectory_number - 1
+
+
+def update_all_data_from(folder_name, number_of_files, manifest=None, processes=None):
+    """
+    Incremental load_all_data_from: hash every part file, relabel only the new or changed ones (in parallel) and
+    rebuild the merged outputs from the per file caches. Route numbers are cached per file and shifted by the
+    route counts of the files before it when merging, so they match a full parallel run.
+    Writes RouteFeatures.parquet, OD-Matrix.csv, OD-Baselines.json, CellTransitions.npz and RouteNumbers.txt.
+    :return: (merged route feature table, merged origin-destination counts, merged OD baselines, merged cell
+              transition model)
+    """
+    if manifest is None:
+        manifest = ReprocessingManifest()
+
+    file_names = [part_file_name(i) for i in range(0, number_of_files)]
+    paths = [os.getcwd() + folder_name + file_name for file_name in file_names]
+    digests = [manifest.current_hash(path) for path in paths]
+
+    stale = [i for i, (path, digest) in enumerate(zip(paths, digests)) if not manifest.is_current(path, digest)]
+    print(len(stale), ' of ', len(paths), ' part files need processing')
+
+    if stale:
+        cache_names = [digests[i] for i in stale]
+
+        with Pool(processes) as pool:
+            route_counts = pool.starmap(process_part_file, [(file_names[i], folder_name, manifest.cache_directory,
+                                                             cache_name) for i, cache_name in zip(stale, cache_names)])
+
+        for i, cache_name, route_count in zip(stale, cache_names, route_counts):
+            manifest.record(paths[i], digests[i], cache_name, route_count)
+        manifest.save()
+
+    return merge_cached_outputs(manifest, paths)
+
+
+def route_number_offsets(manifest, paths):
+    offsets = []
+    trajectory_number = 1
+
+    for path in paths:
+        offsets.append(trajectory_number - 1)
+        trajectory_number += manifest.entries[path]['route_count']
+
+    return offsets, trajectory_number
+
+
+def merge_cached_outputs(manifest, paths):
+    """
+    Combine the cached per file outputs without touching the raw data: OD counts and transition counts add up,
+    sketches merge and route features only need their route numbers shifted.
+    """
+    offsets, trajectory_number = route_number_offsets(manifest, paths)
+    feature_tables = []
+    od_counts = None
+    baselines = ODBaselines()
+    transitions = CellTransitionModel()
+
+    for path, offset in zip(paths, offsets):
+        cache_name = manifest.entries[path]['cache_name']
+
+        features = load_parquet_as_df(cache_name + '-features.parquet', manifest.cache_directory)
+        feature_tables.append(features.assign(route_number=features['route_number'] + offset))
+
+        counts = pd.read_csv(os.getcwd() + manifest.cache_directory + cache_name + '-od.csv', index_col='origin')
+        od_counts = counts if od_counts is None else od_counts.add(counts, fill_value=0)
+        baselines.merge(load_od_baselines(os.getcwd() + manifest.cache_directory + cache_name + '-baselines.json'))
+        transitions.merge(load_transition_model(os.getcwd() + manifest.cache_directory + cache_name +
+                                                '-transitions.npz'))
+
+    features = pd.concat(feature_tables, ignore_index=True).set_index('route_number')
+    save_df_as_parquet(features.reset_index(), 'RouteFeatures.parquet')
+    od_counts.to_csv('OD-Matrix.csv', encoding='utf-8')
+    baselines.save('OD-Baselines.json')
+    transitions.save('CellTransitions.npz')
+
+    with open('RouteNumbers.txt', 'w') as f:
+        f.write('%d' % trajectory_number)
+
+    print('Merged ', len(features), ' relevant routes from ', len(paths), ' part files')
+    return features, od_counts, baselines, transitions
+
+
+def load_relevant_trajectories(manifest, folder_name, number_of_files):
+    """
+    Relevant readings of every part file from the cache, route numbers shifted like merge_cached_outputs.
+    """
+    paths = [os.getcwd() + folder_name + part_file_name(i) for i in range(0, number_of_files)]
+    offsets, _ = route_number_offsets(manifest, paths)
+    dfs = []
+
+    for path, offset in zip(paths, offsets):
+        df = load_parquet_as_df(manifest.entries[path]['cache_name'] + '-relevant.parquet', manifest.cache_directory)
+        dfs.append(df.assign(route_number=df['route_number'] + offset))
+
+    return pd.concat(dfs)
@@ -0,0 +1,223 @@
+import math
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+#################################################################
+# Optional compiled loops for the sequential per reading passes #
+#################################################################
+
+# vectorized numpy unless set_backend('numba') is called
+backend = 'numpy'
+
+
+def set_backend(name):
+    """
+    :param name: 'numba' for the compiled loops or 'numpy' for the vectorized versions
+    """
+    global backend
+
+    if name not in ('numba', 'numpy'):
+        raise ValueError('Unknown backend ' + str(name))
+    if name == 'numba' and numba is None:
+        raise ImportError('numba is not installed, only the numpy backend is available')
+
+    backend = name
+
+
+def use_compiled():
+    return backend == 'numba'
+
+
+def jit(func):
+    if numba is None:
+        return func
+
+    return numba.njit(cache=True)(func)
+
+
+@jit
+def label_routes_compiled(occupied, taxi_codes, trajectory_number):
+    """
+    Occupancy state machine over readings sorted by taxi and time, same rules as segment_trajectories.
+    :return: (route numbers, route_start, route_end, next unused trajectory number)
+    """
+    n = len(occupied)
+    route_numbers = np.empty(n, dtype=np.int64)
+    route_start = np.zeros(n, dtype=np.bool_)
+    route_end = np.zeros(n, dtype=np.bool_)
+
+    previous = False
+    for i in range(n):
+        if i == 0 or taxi_codes[i] != taxi_codes[i - 1]:
+            previous = False
+
+        route_start[i] = occupied[i] and not previous
+        route_end[i] = previous and not occupied[i]
+
+        if occupied[i] or route_end[i]:
+            route_numbers[i] = trajectory_number
+        else:
+            route_numbers[i] = -1
+
+        if route_end[i]:
+            trajectory_number += 1
+        previous = occupied[i]
+
+    return route_numbers, route_start, route_end, trajectory_number
+
+
+@jit
+def route_distances_compiled(lat, long, route_numbers, trip_starts, earth_radius_km):
+    """
+    Haversine distance to the previous reading of the same route and taxi plus the running total of each route,
+    for readings sorted by route, taxi and time.
+    :param trip_starts: True on the first reading of every route and of every taxi's part of a shared route
+    :return: (segment distances, route length for each run of equal route numbers)
+    """
+    n = len(lat)
+    distances = np.zeros(n)
+    totals = np.zeros(n)
+    runs = 0
+
+    for i in range(n):
+        if i == 0 or route_numbers[i] != route_numbers[i - 1]:
+            runs += 1
+            continue
+        if trip_starts[i]:
+            continue
+
+        lat_one, lat_two = math.radians(lat[i - 1]), math.radians(lat[i])
+        long_one, long_two = math.radians(long[i - 1]), math.radians(long[i])
+        a = math.sin((lat_two - lat_one) / 2) ** 2 + \
+            math.cos(lat_one) * math.cos(lat_two) * math.sin((long_two - long_one) / 2) ** 2
+
+        distances[i] = 2 * earth_radius_km * math.asin(math.sqrt(min(a, 1.0)))
+        totals[runs - 1] += distances[i]
+
+    return distances, totals[:runs]
+
+
+@jit
+def popcount(word):
+    count = 0
+    while word:
+        word &= word - np.uint64(1)
+        count += 1
+
+    return count
+
+
+@jit
+def lcs_lengths_compiled(symbols, offsets, match_masks, reference_lengths):
+    """
+    Bit-parallel LCS (Hyyro) of every sequence against every reference, one word per 64 reference positions.
+    :param symbols: concatenated sequences as reference alphabet indices, -1 for symbols no reference has
+    :param offsets: start of each sequence in symbols, plus the total length at the end
+    :param match_masks: uint64 array (references, alphabet, words), bit i set where reference position i holds
+                        the symbol
+    :param reference_lengths: length of each reference
+    :return: int64 array (sequences, references) of LCS lengths
+    """
+    sequences = len(offsets) - 1
+    references, _, words = match_masks.shape
+    lengths = np.zeros((sequences, references), dtype=np.int64)
+    v = np.empty(words, dtype=np.uint64)
+    all_ones = ~np.uint64(0)
+
+    for sequence in range(sequences):
+        for reference in range(references):
+            v[:] = all_ones
+
+            for i in range(offsets[sequence], offsets[sequence + 1]):
+                symbol = symbols[i]
+                if symbol < 0:
+                    continue
+
+                carry = np.uint64(0)
+                for w in range(words):
+                    mask = match_masks[reference, symbol, w]
+                    u = v[w] & mask
+                    total = v[w] + u
+                    overflow = np.uint64(1) if total < v[w] else np.uint64(0)
+                    total_with_carry = total + carry
+                    if total_with_carry < total:
+                        overflow = np.uint64(1)
+
+                    v[w] = total_with_carry | (v[w] & ~mask)
+                    carry = overflow
+
+            zeros = 0
+            remaining = reference_lengths[reference]
+            for w in range(words):
+                bits = min(remaining, 64)
+                if bits > 0:
+                    word = ~v[w]
+                    if bits < 64:
+                        word &= (np.uint64(1) << np.uint64(bits)) - np.uint64(1)
+                    zeros += popcount(word)
+                remaining -= bits
+
+            lengths[sequence, reference] = zeros
+
+    return lengths
+
+
+def check_backend_parity(n=1000000, taxis=1000, seed=0):
+    """
+    Run both backends on the same random readings and compare: route labels and cell path LCS lengths must be
+    identical and distances equal up to float rounding.
+    :return: True when they agree
+    """
+    import pandas as pd
+    from segment_trajectories import segment_trajectories
+    from route_distances import route_segment_distances
+    from cell_sequences import match_masks, to_symbols, lcs_lengths
+
+    if numba is None:
+        print('numba is not installed, nothing to compare')
+        return True
+
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'taxi_id': rng.integers(0, taxis, n),
+                       'time': pd.Timestamp('2014-04-06') + pd.to_timedelta(rng.permutation(n), unit='s'),
+                       'latitude': 22.5 + rng.random(n) * 0.2,
+                       'longitude': 113.8 + rng.random(n) * 0.3,
+                       'occupancy_status': rng.integers(0, 2, n)})
+    paths = [rng.integers(0, 500, length) for length in (30, 64, 100)]
+    alphabet, masks, lengths = match_masks(paths)
+    symbols = to_symbols(rng.integers(0, 1000, n // 10), alphabet)
+    offsets = np.r_[np.arange(0, n // 10, 100), n // 10].astype(np.int64)
+
+    results = {}
+    previous_backend = backend
+    try:
+        for name in ('numpy', 'numba'):
+            set_backend(name)
+            labeled, next_number = segment_trajectories(df)
+            routes, route_distances = route_segment_distances(labeled)
+            results[name] = (labeled, next_number, routes, route_distances,
+                             lcs_lengths(symbols, offsets, masks, lengths))
+    finally:
+        set_backend(previous_backend)
+
+    numpy_result, numba_result = results['numpy'], results['numba']
+    labels = ['route_number', 'route_start', 'route_end']
+
+    same_labels = numpy_result[0][labels].equals(numba_result[0][labels]) and numpy_result[1] == numba_result[1]
+    same_segments = np.allclose(numpy_result[2]['segment_distance_km'], numba_result[2]['segment_distance_km'],
+                                rtol=1e-12, atol=1e-12)
+    same_routes = numpy_result[3].index.equals(numba_result[3].index) and \
+        np.allclose(numpy_result[3], numba_result[3], rtol=1e-9, atol=1e-9)
+    same_lcs = np.array_equal(numpy_result[4], numba_result[4])
+
+    print('Labels match: ', same_labels, ' segment distances match: ', same_segments,
+          ' route distances match: ', same_routes, ' LCS lengths match: ', same_lcs)
+    return same_labels and same_segments and same_routes and same_lcs
+
+
+if __name__ == '__main__':
+    check_backend_parity()
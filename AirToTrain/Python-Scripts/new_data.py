@@ -0,0 +1,122 @@
+import pandas as pd
+import os
+from segment_trajectories import segment_trajectories
+
+
+def load_csv_as_df(file_name, sub_directories, column_numbers=None, column_names=None):
+    '''
+    Load any csv as a pandas dataframe. Provide the filename, the subdirectories, and columns to read(if desired).
+    '''
+    base_path = os.getcwd()
+    full_path = base_path + sub_directories + file_name
+
+    if column_numbers is not None:
+        df = pd.read_csv(full_path, usecols=column_numbers)
+    else:
+        df = pd.read_csv(full_path)
+
+    if column_names is not None:
+        df.columns = column_names
+
+    return df
+
+
+def label_trajectories(df, trajectory_number):
+    df, trajectory_number = segment_trajectories(df, trajectory_number, station_flags=True)
+    df = df[df.route_number != -1]
+
+    print('Done mapping trajectories!')
+    return df, trajectory_number
+
+
+def find_trajectories_at_airport_or_bus(df):
+    # Test this method!
+    air_to_bus_df = df[(df['airport_start'] == True) & (df['train_end'] == True)]
+    bus_to_air_df = df[(df['train_start'] == True) & (df['airport_end'] == True)]
+
+    relevant_air_to_bus_numbers = air_to_bus_df.route_number.unique()
+    relevant_bus_to_air_numbers = bus_to_air_df.route_number.unique()
+
+    route_numbers = relevant_air_to_bus_numbers + relevant_bus_to_air_numbers
+
+    print('Found ', len(route_numbers), ' relevant routes!')
+
+    return df[df['route_number'].isin(route_numbers)]
+
+
+def near_airport(lat, long):
+    if 22.605770 <= lat <= 22.667089 and 113.784647 <= long <= 113.837340:
+        return True
+    else:
+        return False
+
+
+def near_bus_station(lat, long):
+    if 22.567210 <= lat <= 22.568807 and 114.089676 <= long <= 114.091320:
+        return True
+    else:
+        return False
+
+
+def near_train_station(lat, long):
+    if 22.604998 <= lat <= 22.614221 and 114.021111 <= long <= 114.034778:
+        return True
+    else:
+        return False
+
+
+def load_data_and_find_relevant_routes(file_name, sub_directories, trajectory_number):
+    col_numbers = [3, 4, 5, 6, 7, 8, 12]
+    col_names = ['longitude', 'latitude', 'time', 'taxi_id', 'speed', 'direction', 'occupancy_status']
+
+    df = load_csv_as_df(file_name, sub_directories, col_numbers, col_names)
+    df, new_trajectory_number = label_trajectories(df, trajectory_number)
+
+    labeled_file_name = file_name + '-With-Trajectories.csv'
+    df.to_csv(labeled_file_name, encoding='utf-8')
+
+    relevant_df = find_trajectories_at_airport_or_bus(df)
+    csv_file_name = file_name + '.csv'
+
+    relevant_df.to_csv(csv_file_name, encoding='utf-8')
+
+    with open('RouteNumbers.txt', 'w') as f:
+        f.write('%d' % new_trajectory_number)
+
+    print('\n\n')
+    print("###########################################################")
+    print('Found ', len(relevant_df), ' relevant routes in ', file_name)
+    print('Current Trajectory Number: ', new_trajectory_number)
+
+    return relevant_df, new_trajectory_number
+
+
+def load_all_data_from(folder_name, number_of_files):
+    trajectory_number = 1
+    base_file_name = 'part-m-'
+    relevant_dfs = []
+
+    for i in range(0, number_of_files):
+    # for i in range(0, number_of_files):
+
+        if i < 10:
+            file_number = '0000' + str(i)
+        else:
+            file_number = '000' + str(i)
+
+        file_name = base_file_name + file_number
+        df, new_trajectory_number = load_data_and_find_relevant_routes(file_name, folder_name, trajectory_number)
+
+        relevant_dfs.append(df)
+        trajectory_number = new_trajectory_number
+
+        print('new_trajectory_number: ', new_trajectory_number)
+
+    return relevant_dfs
+
+
+if __name__ == '__main__':
+    all_relevant_df_list = load_all_data_from('/2014-04-06/', 76)
+
+    dfs = pd.concat(all_relevant_df_list)
+    dfs.to_csv('RelevantTrajectories.csv', encoding='utf-8')
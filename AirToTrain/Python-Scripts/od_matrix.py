@@ -0,0 +1,65 @@
+import pandas as pd
+from regions import shenzhen_regions
+from route_summary import route_endpoints, classify_endpoints
+from columnar_store import save_df_as_parquet, load_parquet_as_df
+
+#######################################################################
+# Origin-destination matrix over every registered hub in a single pass#
+#######################################################################
+
+
+def od_count_matrix(endpoints, registry=shenzhen_regions):
+    """
+    :param endpoints: classified endpoint table
+    :return: data-frame of trip counts, origins as rows and destinations as columns, one of each per hub
+    """
+    hub_trips = endpoints.dropna(subset=['start_region', 'end_region'])
+    matrix = pd.crosstab(hub_trips['start_region'], hub_trips['end_region'])
+
+    matrix = matrix.reindex(index=registry.hubs, columns=registry.hubs, fill_value=0)
+    matrix.index.name = 'origin'
+    matrix.columns.name = 'destination'
+
+    return matrix
+
+
+def label_od_pairs(df, endpoints):
+    """
+    Broadcast each route's origin and destination hub onto its readings and keep only hub to hub trips.
+    """
+    hub_trips = endpoints.dropna(subset=['start_region', 'end_region'])
+    route_numbers = df['route_number'].to_numpy()
+
+    positions = hub_trips.index.get_indexer(route_numbers)
+    on_hub_trip = positions >= 0
+
+    return df[on_hub_trip].assign(origin=hub_trips['start_region'].to_numpy()[positions[on_hub_trip]],
+                                  destination=hub_trips['end_region'].to_numpy()[positions[on_hub_trip]])
+
+
+def build_od_matrix(df, registry=shenzhen_regions, dataset_name='OD-Trips.parquet', matrix_file_name='OD-Matrix.csv'):
+    """
+    Assign every labeled trip to an (origin hub, destination hub) pair, write the trips partitioned by pair and
+    save the count matrix. Any corridor can then be loaded with load_od_trips without scanning the data again.
+    :param df: labeled data-frame
+    :return: count matrix
+    """
+    endpoints = classify_endpoints(route_endpoints(df), registry)
+    matrix = od_count_matrix(endpoints, registry)
+
+    od_df = label_od_pairs(df, endpoints)
+    print('Found ', od_df['route_number'].nunique(), ' hub to hub trips out of ', len(endpoints), ' routes')
+
+    if len(od_df):
+        save_df_as_parquet(od_df, dataset_name, partition_cols=['origin', 'destination'])
+    matrix.to_csv(matrix_file_name, encoding='utf-8')
+
+    return matrix
+
+
+def load_od_trips(origin, destination, dataset_name='OD-Trips.parquet', columns=None):
+    """
+    Read only the partition for one corridor.
+    """
+    return load_parquet_as_df(dataset_name, columns=columns,
+                              filters=[('origin', '=', origin), ('destination', '=', destination)])
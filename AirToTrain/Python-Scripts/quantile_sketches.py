@@ -0,0 +1,181 @@
+import json
+import pandas as pd
+import numpy as np
+from regions import shenzhen_regions
+from route_summary import classify_endpoints
+
+#####################################################################
+# Mergeable quantile sketches of trip time and distance per OD pair #
+#####################################################################
+
+sketched_features = ['duration_in_seconds', 'distance_in_km']
+
+
+class QuantileSketch(object):
+    """
+    Small t-digest style summary of a stream of values: weighted centroids that are fine near the tails and coarse
+    in the middle, so high percentiles stay accurate with a few hundred centroids. Sketches of different part
+    files merge by pooling their centroids.
+    """
+
+    def __init__(self, compression=200, means=None, weights=None, minimum=np.inf, maximum=-np.inf):
+        self.compression = compression
+        self.means = np.zeros(0) if means is None else np.asarray(means, dtype=float)
+        self.weights = np.zeros(0) if weights is None else np.asarray(weights, dtype=float)
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @property
+    def count(self):
+        return self.weights.sum()
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return self
+
+        self.minimum = min(self.minimum, values.min())
+        self.maximum = max(self.maximum, values.max())
+        self.add_centroids(values, np.ones(len(values)))
+
+        return self
+
+    def merge(self, other):
+        if other.count:
+            self.minimum = min(self.minimum, other.minimum)
+            self.maximum = max(self.maximum, other.maximum)
+            self.add_centroids(other.means, other.weights)
+
+        return self
+
+    def add_centroids(self, means, weights):
+        """
+        Pool the new centroids with the current ones and re-cluster them in one vectorized pass: every centroid
+        goes to the cluster of the arcsine scale value at the middle of its weight, which keeps clusters small at
+        both tails.
+        """
+        means = np.r_[self.means, means]
+        weights = np.r_[self.weights, weights]
+
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+
+        total = weights.sum()
+        middles = (np.cumsum(weights) - weights / 2) / total
+        clusters = np.floor(self.compression / np.pi * (np.arcsin(2 * middles - 1) + np.pi / 2)).astype(np.int64)
+        clusters = np.unique(clusters, return_inverse=True)[1]
+
+        self.weights = np.bincount(clusters, weights=weights)
+        self.means = np.bincount(clusters, weights=means * weights) / self.weights
+
+    def quantile(self, q):
+        """
+        :param q: fraction or array of fractions between 0 and 1
+        :return: estimated value(s), NaN for an empty sketch
+        """
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+
+        positions = np.r_[0.0, (np.cumsum(self.weights) - self.weights / 2) / self.count, 1.0]
+        values = np.r_[self.minimum, self.means, self.maximum]
+
+        return np.interp(q, positions, values)
+
+    def to_dict(self):
+        return {'compression': self.compression, 'means': self.means.tolist(), 'weights': self.weights.tolist(),
+                'minimum': float(self.minimum), 'maximum': float(self.maximum)}
+
+    @staticmethod
+    def from_dict(values):
+        return QuantileSketch(values['compression'], values['means'], values['weights'], values['minimum'],
+                              values['maximum'])
+
+
+class ODBaselines(object):
+    """
+    A duration and a distance sketch for every (origin hub, destination hub) pair seen so far.
+    """
+
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.sketches = {}
+
+    def sketch(self, origin, destination, feature):
+        key = (origin, destination, feature)
+        if key not in self.sketches:
+            self.sketches[key] = QuantileSketch(self.compression)
+
+        return self.sketches[key]
+
+    def update(self, features, registry=shenzhen_regions):
+        """
+        Add the routes of a feature table (one part file, one day...) to the sketches of their OD pair.
+        """
+        if 'start_region' not in features.columns:
+            features = classify_endpoints(features, registry)
+
+        hub_trips = features.dropna(subset=['start_region', 'end_region'])
+        for (origin, destination), trips in hub_trips.groupby(['start_region', 'end_region']):
+            for feature in sketched_features:
+                self.sketch(origin, destination, feature).update(trips[feature].to_numpy(dtype=float))
+
+        return self
+
+    def merge(self, other):
+        for (origin, destination, feature), sketch in other.sketches.items():
+            self.sketch(origin, destination, feature).merge(sketch)
+
+        return self
+
+    def cutoffs(self, duration_percentile=95, distance_percentile=95):
+        """
+        :return: data-frame indexed by (origin, destination) with route_count, duration_cutoff and distance_cutoff
+        """
+        rows = []
+        pairs = sorted(set((origin, destination) for origin, destination, _ in self.sketches))
+
+        for origin, destination in pairs:
+            duration = self.sketch(origin, destination, 'duration_in_seconds')
+            distance = self.sketch(origin, destination, 'distance_in_km')
+            rows.append((origin, destination, int(duration.count), duration.quantile(duration_percentile / 100.0),
+                         distance.quantile(distance_percentile / 100.0)))
+
+        cutoffs = pd.DataFrame(rows, columns=['origin', 'destination', 'route_count', 'duration_cutoff',
+                                              'distance_cutoff'])
+        return cutoffs.set_index(['origin', 'destination'])
+
+    def save(self, file_name):
+        with open(file_name, 'w') as f:
+            json.dump({'compression': self.compression,
+                       'sketches': [[origin, destination, feature, sketch.to_dict()]
+                                    for (origin, destination, feature), sketch in self.sketches.items()]}, f)
+
+
+def load_od_baselines(file_name):
+    with open(file_name) as f:
+        saved = json.load(f)
+
+    baselines = ODBaselines(saved['compression'])
+    for origin, destination, feature, sketch in saved['sketches']:
+        baselines.sketches[(origin, destination, feature)] = QuantileSketch.from_dict(sketch)
+
+    return baselines
+
+
+def find_fraud_routes_by_percentile(features, baselines, duration_percentile=95, distance_percentile=95,
+                                    registry=shenzhen_regions):
+    """
+    find_fraud_routes_by_time_distance with the cutoffs taken from each route's own OD pair baseline instead of
+    numbers typed into a notebook.
+    :param features: route feature table
+    :return: feature rows of routes at or above both cutoffs of their pair, with the cutoffs joined on
+    """
+    if 'start_region' not in features.columns:
+        features = classify_endpoints(features, registry)
+
+    cutoffs = baselines.cutoffs(duration_percentile, distance_percentile)
+    scored = features.join(cutoffs[['duration_cutoff', 'distance_cutoff']], on=['start_region', 'end_region'])
+
+    return scored[(scored['distance_in_km'] >= scored['distance_cutoff']) &
+                  (scored['duration_in_seconds'] >= scored['duration_cutoff'])]
@@ -0,0 +1,152 @@
+import os
+import json
+import numpy as np
+
+#####################################################################
+# Named regions (boxes and polygons) with a grid bucket point index #
+#####################################################################
+
+default_regions_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'regions.json')
+no_region = -1
+
+
+def points_in_polygon(lat, long, polygon):
+    """
+    Vectorized ray casting test.
+    :param polygon: array of (lat, long) vertices
+    :return: boolean array
+    """
+    inside = np.zeros(len(lat), dtype=bool)
+    polygon = np.asarray(polygon, dtype=float)
+
+    for i in range(len(polygon)):
+        lat_one, long_one = polygon[i - 1]
+        lat_two, long_two = polygon[i]
+
+        crosses = (lat_one > lat) != (lat_two > lat)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crossing_long = long_one + (lat - lat_one) * (long_two - long_one) / (lat_two - lat_one)
+
+        inside ^= crosses & (long < crossing_long)
+
+    return inside
+
+
+class RegionRegistry(object):
+    """
+    Classifies millions of GPS points into region ids at once. Every region is registered in the grid buckets its
+    bounding box touches, so a point is only tested against the handful of regions in its own bucket and adding
+    more regions doesn't add passes over the data. Regions listed first win when they overlap.
+    """
+
+    def __init__(self, regions, bucket_size=0.01):
+        """
+        :param regions: list of dicts with a name and either a box [min_lat, max_lat, min_long, max_long]
+                        or a polygon [[lat, long], ...]; regions with "hub": false are only looked up by name
+                        (contains) and never returned by classify
+        :param bucket_size: grid bucket size in degrees
+        """
+        self.regions = regions
+        self.names = [region['name'] for region in regions]
+        self.hubs = [region['name'] for region in regions if region.get('hub', True)]
+        self.bucket_size = bucket_size
+        self.boxes = np.array([self.bounding_box(region) for region in regions], dtype=float).reshape(-1, 4)
+
+        self.min_lat = self.boxes[:, 0].min() if len(regions) else 0.0
+        self.min_long = self.boxes[:, 2].min() if len(regions) else 0.0
+        self.rows = int((self.boxes[:, 1].max() - self.min_lat) // bucket_size) + 1 if len(regions) else 0
+        self.cols = int((self.boxes[:, 3].max() - self.min_long) // bucket_size) + 1 if len(regions) else 0
+
+        buckets = [[] for _ in range(self.rows * self.cols)]
+        for region_id, box in enumerate(self.boxes):
+            if not regions[region_id].get('hub', True):
+                continue
+            first_row, last_row = self.bucket_rows(box[0]), self.bucket_rows(box[1])
+            first_col, last_col = self.bucket_cols(box[2]), self.bucket_cols(box[3])
+
+            for row in range(first_row, last_row + 1):
+                for col in range(first_col, last_col + 1):
+                    buckets[row * self.cols + col].append(region_id)
+
+        # bucket -> candidate region ids in priority order, padded with no_region
+        depth = max([len(bucket) for bucket in buckets] + [1])
+        self.candidates = np.full((len(buckets), depth), no_region, dtype=np.int32)
+        for index, bucket in enumerate(buckets):
+            self.candidates[index, :len(bucket)] = bucket
+
+    @staticmethod
+    def bounding_box(region):
+        if 'box' in region:
+            return region['box']
+
+        polygon = np.asarray(region['polygon'], dtype=float)
+        return [polygon[:, 0].min(), polygon[:, 0].max(), polygon[:, 1].min(), polygon[:, 1].max()]
+
+    def bucket_rows(self, lat):
+        rows = np.floor((np.asarray(lat, dtype=float) - self.min_lat) / self.bucket_size)
+        return np.nan_to_num(rows, nan=-1).astype(np.int64)
+
+    def bucket_cols(self, long):
+        cols = np.floor((np.asarray(long, dtype=float) - self.min_long) / self.bucket_size)
+        return np.nan_to_num(cols, nan=-1).astype(np.int64)
+
+    def region_id(self, name):
+        return self.names.index(name)
+
+    def contains_points(self, region_id, lat, long):
+        region = self.regions[region_id]
+        box = self.boxes[region_id]
+        inside = (box[0] <= lat) & (lat <= box[1]) & (box[2] <= long) & (long <= box[3])
+
+        if 'polygon' in region:
+            inside[inside] = points_in_polygon(lat[inside], long[inside], region['polygon'])
+
+        return inside
+
+    def classify(self, lat, long):
+        """
+        :param lat: array of latitudes
+        :param long: array of longitudes
+        :return: int32 array with the region id of every point, no_region (-1) when it is in none of them
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=float))
+        long = np.atleast_1d(np.asarray(long, dtype=float))
+        region_ids = np.full(len(lat), no_region, dtype=np.int32)
+
+        rows = self.bucket_rows(lat)
+        cols = self.bucket_cols(long)
+        on_grid = np.flatnonzero((rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols))
+        candidates = self.candidates[rows[on_grid] * self.cols + cols[on_grid]]
+
+        for depth in range(candidates.shape[1]):
+            unassigned = region_ids[on_grid] == no_region
+            level = candidates[:, depth]
+
+            for region_id in np.unique(level[unassigned & (level != no_region)]):
+                tested = unassigned & (level == region_id)
+                points = on_grid[tested]
+                inside = self.contains_points(region_id, lat[points], long[points])
+                region_ids[points[inside]] = region_id
+
+        return region_ids
+
+    def contains(self, name, lat, long):
+        """
+        True where the points fall inside the named region, even if an earlier region overlaps it.
+        Works on scalars as well as arrays.
+        """
+        lat_array = np.atleast_1d(np.asarray(lat, dtype=float))
+        long_array = np.atleast_1d(np.asarray(long, dtype=float))
+        inside = self.contains_points(self.region_id(name), lat_array, long_array)
+
+        return bool(inside[0]) if np.ndim(lat) == 0 else inside
+
+
+def load_regions(file_name=default_regions_file):
+    with open(file_name) as f:
+        config = json.load(f)
+
+    return RegionRegistry(config['regions'], config.get('bucket_size', 0.01))
+
+
+shenzhen_regions = load_regions()
@@ -0,0 +1,107 @@
+import pandas as pd
+import numpy as np
+from time_parsing import to_epoch_seconds
+from trajectory_index import contiguous_runs
+import kernels
+
+###################################################
+# Haversine distances for every route in one pass #
+###################################################
+
+earth_radius_km = 6371.0
+
+
+def haversine_km(lat_one, long_one, lat_two, long_two):
+    """
+    Vectorized great circle distance, same formula and earth radius as mpu.haversine_distance.
+    :return: distance in km, element-wise
+    """
+    lat_one, long_one, lat_two, long_two = [np.radians(np.asarray(values, dtype=float))
+                                            for values in (lat_one, long_one, lat_two, long_two)]
+
+    a = np.sin((lat_two - lat_one) / 2) ** 2 + \
+        np.cos(lat_one) * np.cos(lat_two) * np.sin((long_two - long_one) / 2) ** 2
+
+    return 2 * earth_radius_km * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def sort_by_route_and_time(df):
+    """
+    Stable sort of the route readings (route_number != -1) by route number, taxi and time. A route still open at
+    the end of a taxi's readings shares its number with the next taxi's first route (see segment_trajectories), so
+    each taxi's part of a shared number is kept together instead of interleaved by time.
+    """
+    routes = df[df['route_number'] != -1]
+    route_numbers = routes['route_number'].to_numpy()
+    times = to_epoch_seconds(routes['time'])
+
+    if 'taxi_id' in routes.columns:
+        taxi_codes, _ = pd.factorize(routes['taxi_id'], sort=True)
+    else:
+        taxi_codes = np.zeros(len(routes), dtype=np.int64)
+
+    # output of an earlier sort (e.g. a TrajectoryStore or OD partition) needs no reordering
+    same_route = route_numbers[1:] == route_numbers[:-1]
+    same_taxi = same_route & (taxi_codes[1:] == taxi_codes[:-1])
+    if np.all((route_numbers[1:] > route_numbers[:-1]) | (same_route & (taxi_codes[1:] > taxi_codes[:-1])) |
+              (same_taxi & (times[1:] >= times[:-1]))):
+        return routes
+
+    return routes.iloc[np.lexsort((times, taxi_codes, route_numbers))]
+
+
+def trip_starts(routes):
+    """
+    :param routes: data-frame sorted by sort_by_route_and_time
+    :return: boolean array, True on the first reading of every route and of every taxi's part of a shared route
+    """
+    route_numbers = routes['route_number'].to_numpy()
+    starts = np.ones(len(routes), dtype=bool)
+
+    if len(routes) > 1:
+        starts[1:] = route_numbers[1:] != route_numbers[:-1]
+        if 'taxi_id' in routes.columns:
+            taxi_ids = routes['taxi_id'].to_numpy()
+            starts[1:] |= taxi_ids[1:] != taxi_ids[:-1]
+
+    return starts
+
+
+def segment_distances(df):
+    """
+    Distance from every reading to the previous reading of the same route and taxi, in time order.
+    :param df: data-frame sorted by sort_by_route_and_time
+    :return: float array, 0 for the first reading of each route and of each taxi's part of a shared route
+    """
+    lat = df['latitude'].to_numpy(dtype=float)
+    long = df['longitude'].to_numpy(dtype=float)
+
+    distances = np.zeros(len(df))
+    if len(df) > 1:
+        distances[1:] = np.where(trip_starts(df)[1:], 0.0, haversine_km(lat[:-1], long[:-1], lat[1:], long[1:]))
+
+    return distances
+
+
+def route_segment_distances(df):
+    """
+    :param df: labeled data-frame, any order
+    :return: (route readings sorted by route, taxi and time with a segment_distance_km column,
+              series of route lengths in km indexed by route_number)
+    """
+    routes = sort_by_route_and_time(df)
+
+    if kernels.use_compiled():
+        route_numbers = routes['route_number'].to_numpy()
+        distances, totals = kernels.route_distances_compiled(routes['latitude'].to_numpy(dtype=float),
+                                                             routes['longitude'].to_numpy(dtype=float),
+                                                             route_numbers, trip_starts(routes), earth_radius_km)
+        routes = routes.assign(segment_distance_km=distances)
+        route_distances = pd.Series(totals, index=pd.Index(contiguous_runs(route_numbers)[0], name='route_number'))
+    else:
+        routes = routes.assign(segment_distance_km=segment_distances(routes))
+        route_distances = routes.groupby('route_number', sort=True)['segment_distance_km'].sum()
+
+    route_distances.name = 'distance_in_km'
+
+    return routes, route_distances
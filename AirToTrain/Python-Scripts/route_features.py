@@ -0,0 +1,71 @@
+import numpy as np
+from time_parsing import to_epoch_seconds
+from route_summary import route_endpoints
+from route_distances import haversine_km, route_segment_distances, trip_starts
+
+##################################################
+# One row of features per route in a single pass #
+##################################################
+
+
+def segment_gaps(routes):
+    """
+    Seconds since the previous reading of the same route and taxi.
+    :param routes: data-frame sorted by sort_by_route_and_time
+    :return: float array, 0 for the first reading of each route and of each taxi's part of a shared route
+    """
+    times = to_epoch_seconds(routes['time']).astype(float)
+
+    gaps = np.zeros(len(routes))
+    if len(routes) > 1:
+        gaps[1:] = np.where(trip_starts(routes)[1:], 0.0, times[1:] - times[:-1])
+
+    return gaps
+
+
+def route_feature_table(df):
+    """
+    Replaces the calculate_route_durations / calculate_route_distances / merge / reduce chain.
+    Duration is taken between the route_start and route_end readings like calculate_route_durations, so routes
+    missing either one get NaN there. Column names match the old distance-time csv so
+    find_fraud_routes_by_time_distance works on the table directly.
+    :param df: labeled data-frame
+    :return: data-frame indexed by route_number with taxi_id, reading_count, start_time, end_time,
+             duration_in_seconds, distance_in_km, od_distance_in_km, max_gap_in_seconds, mean_speed_kmh,
+             max_speed_kmh, start_hour and the start/end coordinates
+    """
+    routes, route_distances = route_segment_distances(df)
+    routes = routes.assign(gap_in_seconds=segment_gaps(routes))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        segment_speeds = np.where(routes['gap_in_seconds'] > 0,
+                                  routes['segment_distance_km'] / routes['gap_in_seconds'] * 3600, np.nan)
+    routes = routes.assign(segment_speed_kmh=segment_speeds)
+
+    grouped = routes.groupby('route_number', sort=True)
+    features = route_endpoints(routes).sort_index()
+
+    features['duration_in_seconds'] = (features['end_time'] - features['start_time']).dt.total_seconds()
+    features['distance_in_km'] = route_distances
+    features['od_distance_in_km'] = haversine_km(features['start_latitude'], features['start_longitude'],
+                                                 features['end_latitude'], features['end_longitude'])
+    features['max_gap_in_seconds'] = grouped['gap_in_seconds'].max()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        features['mean_speed_kmh'] = features['distance_in_km'] / features['duration_in_seconds'] * 3600
+    features.loc[features['duration_in_seconds'] <= 0, 'mean_speed_kmh'] = np.nan
+
+    features['max_speed_kmh'] = grouped['segment_speed_kmh'].max()
+    features['start_hour'] = features['start_time'].dt.hour
+
+    return features
+
+
+def save_route_features(df, file_name):
+    """
+    Write the feature table as e.g. all-air-to-train-routes-distance-time.csv.
+    """
+    features = route_feature_table(df)
+    features.reset_index().to_csv(file_name, encoding='utf-8', index=False)
+
+    return features
@@ -0,0 +1,82 @@
+import operator
+import pandas as pd
+import numpy as np
+
+##########################################################
+# Route quality rules applied to the route feature table #
+##########################################################
+
+comparisons = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+# (reason, feature column, comparison, threshold): a route is rejected when the comparison holds.
+# 'missing' rejects NaN values and ignores the threshold.
+default_quality_rules = [
+    ('too_few_readings', 'reading_count', '<', 10),
+    ('missing_start_or_end', 'duration_in_seconds', 'missing', None),
+    ('end_not_after_start', 'duration_in_seconds', '<=', 0),
+    ('excessive_distance', 'distance_in_km', '>=', 100),
+]
+
+
+def with_thresholds(rules=default_quality_rules, **thresholds):
+    """
+    Copy of rules with new thresholds, e.g. with_thresholds(too_few_readings=20, excessive_distance=80).
+    """
+    unknown = set(thresholds) - set(rule[0] for rule in rules)
+    if unknown:
+        raise KeyError('No rules named ' + ', '.join(sorted(unknown)))
+
+    return [(reason, col, op, thresholds.get(reason, threshold)) for reason, col, op, threshold in rules]
+
+
+def rule_mask(features, col, op, threshold):
+    values = features[col]
+    if op == 'missing':
+        return values.isna().to_numpy()
+
+    return comparisons[op](values, threshold).fillna(False).to_numpy(dtype=bool)
+
+
+def filter_routes(features, rules=default_quality_rules):
+    """
+    Evaluate every rule as one vectorized predicate over the feature table. Nothing is re-read, so thresholds can
+    be tuned by calling this again with with_thresholds(...).
+    :param features: route feature table indexed by route_number
+    :return: (features of the kept routes,
+              rejection table with one row per failed rule: route_number, reason, value, threshold)
+    """
+    rejected = np.zeros(len(features), dtype=bool)
+    rejections = []
+
+    for reason, col, op, threshold in rules:
+        failed = rule_mask(features, col, op, threshold)
+        rejected |= failed
+
+        rejections.append(pd.DataFrame({'route_number': features.index[failed],
+                                        'reason': reason,
+                                        'value': features[col].to_numpy()[failed],
+                                        'threshold': threshold}))
+
+    rejections = pd.concat(rejections, ignore_index=True)
+    print('Kept ', int((~rejected).sum()), ' of ', len(features), ' routes')
+    for reason, count in rejections['reason'].value_counts().items():
+        print('  ', count, ' routes rejected for ', reason)
+
+    return features[~rejected], rejections
+
+
+def readings_of_routes(df, route_features, index=None):
+    """
+    GPS readings of the routes in a (filtered) feature table, through a TrajectoryIndex when one is given.
+    """
+    if index is not None:
+        return index.routes(route_features.index)
+
+    return df[df['route_number'].isin(route_features.index)]
@@ -0,0 +1,61 @@
+import pandas as pd
+import numpy as np
+from time_parsing import parse_gps_times
+from regions import shenzhen_regions, no_region
+
+###############################################
+# One row per route: who, when, where from/to #
+###############################################
+
+endpoint_cols = ['time', 'latitude', 'longitude']
+
+
+def route_endpoints(df):
+    """
+    Build the route endpoint table in one pass instead of masking the whole data-frame for every route.
+    Start and end values come from the first route_start and route_end reading of each route, like the
+    .iloc[0] lookups they replace. Routes missing a start or an end get NaN there.
+    :param df: labeled data-frame with route_number, route_start, route_end, taxi_id, latitude and longitude
+    :return: data-frame indexed by route_number with taxi_id, reading_count, start_time, start_latitude,
+             start_longitude, end_time, end_latitude and end_longitude
+    """
+    routes = df[df['route_number'] != -1]
+    cols = [col for col in endpoint_cols if col in routes.columns]
+
+    if 'time' in cols:
+        routes = routes.assign(time=parse_gps_times(routes['time']))
+
+    grouped = routes.groupby('route_number', sort=False)
+    endpoints = pd.DataFrame({'taxi_id': grouped['taxi_id'].first(), 'reading_count': grouped.size()})
+
+    for prefix, flag in [('start_', 'route_start'), ('end_', 'route_end')]:
+        rows = routes[routes[flag] == True].drop_duplicates('route_number', keep='first')
+        endpoints = endpoints.join(rows.set_index('route_number')[cols].add_prefix(prefix))
+
+    return endpoints
+
+
+def classify_endpoints(endpoints, registry=shenzhen_regions):
+    """
+    Add start_region and end_region names (None outside every region) with one vectorized lookup per side.
+    """
+    names = np.array(registry.names + [None], dtype=object)
+    classified = {}
+
+    for prefix in ['start_', 'end_']:
+        region_ids = registry.classify(endpoints[prefix + 'latitude'].to_numpy(dtype=float),
+                                       endpoints[prefix + 'longitude'].to_numpy(dtype=float))
+        classified[prefix + 'region'] = names[np.where(region_ids == no_region, len(registry.names), region_ids)]
+
+    return endpoints.assign(**classified)
+
+
+def find_routes_between(endpoints, origin, destination):
+    """
+    :param endpoints: classified endpoint table
+    :param origin: region name the route starts in
+    :param destination: region name the route ends in
+    :return: list of route numbers
+    """
+    between = (endpoints['start_region'] == origin) & (endpoints['end_region'] == destination)
+    return endpoints.index[between].tolist()
@@ -0,0 +1,105 @@
+import pandas as pd
+import numpy as np
+from time_parsing import parse_gps_times
+from regions import shenzhen_regions, no_region
+import kernels
+
+#####################################################################
+# Split GPS readings into passenger trips in one sorted, vector pass#
+#####################################################################
+
+def sort_by_taxi_and_time(df):
+    """
+    Stable sort that keeps taxis in the order they first appear in df and orders each taxi's readings by time.
+    This is the order label_trajectories walked the data in, so route numbers come out the same.
+    :return: (sorted df, taxi codes for each sorted row)
+    """
+    taxi_codes, _ = pd.factorize(df['taxi_id'])
+    times = df['time'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    # NaT sorts last just like sort_values
+    times = np.where(times == np.iinfo(np.int64).min, np.iinfo(np.int64).max, times)
+
+    order = np.lexsort((times, taxi_codes))
+    # rows without a taxi id were never visited by label_trajectories
+    order = order[taxi_codes[order] >= 0]
+
+    return df.iloc[order], taxi_codes[order]
+
+
+def occupancy_transitions(occupied, taxi_codes):
+    """
+    Find where passengers get in and out.
+    :param occupied: boolean array of occupancy, sorted by taxi and time
+    :param taxi_codes: integer taxi code for each reading
+    :return: (route_start, route_end) boolean arrays
+    """
+    previous = np.empty_like(occupied)
+    previous[1:] = occupied[:-1]
+
+    # every taxi starts without a passenger
+    if len(previous):
+        previous[0] = False
+        previous[1:][taxi_codes[1:] != taxi_codes[:-1]] = False
+
+    return occupied & ~previous, ~occupied & previous
+
+
+def segment_trajectories(df, trajectory_number=1, station_flags=False):
+    """
+    Label every reading with its route number in a single pass instead of walking each taxi with iterrows.
+    The labels match label_trajectories: readings are visited taxi by taxi (first appearance order) in time
+    order, a route runs from the reading where occupancy turns on up to and including the reading where it
+    turns off, and trajectory_number only advances when a route ends. A route still open at the end of a
+    taxi's readings therefore shares its number with the next route, exactly as before. Readings of one taxi
+    with the same timestamp keep their order in df.
+    :param df: data-frame with taxi_id, time, latitude, longitude and occupancy_status columns
+    :param trajectory_number: number given to the first route
+    :param station_flags: add relevant/airport/train start and end columns
+    :return: (labeled data-frame sorted by taxi and time, next unused trajectory number)
+    """
+    if not pd.api.types.is_datetime64_any_dtype(df['time']):
+        df = df.assign(time=parse_gps_times(df['time']))
+
+    print('There are ', df['taxi_id'].nunique(), ' unique taxi ids in this data')
+
+    df, taxi_codes = sort_by_taxi_and_time(df)
+    occupied = df['occupancy_status'].to_numpy().astype(bool)
+
+    if kernels.use_compiled():
+        route_numbers, route_start, route_end, _ = kernels.label_routes_compiled(occupied, taxi_codes,
+                                                                                 trajectory_number)
+    else:
+        route_start, route_end = occupancy_transitions(occupied, taxi_codes)
+        ended_before = np.cumsum(route_end) - route_end
+        route_numbers = np.where(occupied | route_end, trajectory_number + ended_before, -1)
+
+    df = df.assign(route_number=route_numbers.astype(np.int64), route_start=route_start, route_end=route_end)
+
+    if station_flags:
+        df = add_station_flags(df)
+
+    return df, trajectory_number + int(route_end.sum())
+
+
+def add_station_flags(df):
+    """
+    Mark route starts and ends that fall inside the airport or the north train station region.
+    The airport wins when a point is inside both.
+    """
+    route_start = df['route_start'].to_numpy()
+    route_end = df['route_end'].to_numpy()
+    endpoints = np.flatnonzero(route_start | route_end)
+
+    region_ids = np.full(len(df), no_region, dtype=np.int32)
+    region_ids[endpoints] = shenzhen_regions.classify(df['latitude'].to_numpy()[endpoints],
+                                                      df['longitude'].to_numpy()[endpoints])
+
+    at_airport = region_ids == shenzhen_regions.region_id('airport')
+    at_train = region_ids == shenzhen_regions.region_id('north_train_station')
+
+    return df.assign(relevant_start=route_start & (at_airport | at_train),
+                     relevant_end=route_end & (at_airport | at_train),
+                     airport_start=route_start & at_airport,
+                     airport_end=route_end & at_airport,
+                     train_start=route_start & at_train,
+                     train_end=route_end & at_train)
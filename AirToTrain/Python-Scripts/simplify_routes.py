@@ -0,0 +1,129 @@
+import pandas as pd
+import numpy as np
+from trajectory_index import TrajectoryIndex, contiguous_runs
+from route_distances import sort_by_route_and_time, segment_distances, trip_starts
+
+#########################################################
+# Douglas-Peucker simplification of every route at once #
+#########################################################
+
+meters_per_degree_lat = 110574.0
+meters_per_degree_long = 111320.0
+
+
+def to_local_meters(lat, long, reference_lat=None):
+    """
+    Equirectangular projection around reference_lat (the mean latitude by default), plenty accurate over a city.
+    :return: (x, y) arrays in meters
+    """
+    if reference_lat is None:
+        reference_lat = np.nanmean(lat) if len(lat) else 0.0
+
+    cos_lat = np.cos(np.radians(reference_lat))
+    return long * meters_per_degree_long * cos_lat, lat * meters_per_degree_lat
+
+
+def distances_to_segments(x, y, x_one, y_one, x_two, y_two):
+    """
+    Distance from each point to its segment (not the infinite line), element-wise.
+    """
+    dx, dy = x_two - x_one, y_two - y_one
+    length_squared = dx * dx + dy * dy
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(length_squared > 0, ((x - x_one) * dx + (y - y_one) * dy) / length_squared, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+
+    return np.hypot(x - (x_one + t * dx), y - (y_one + t * dy))
+
+
+def douglas_peucker_mask(x, y, run_starts, run_stops, tolerance_m):
+    """
+    Douglas-Peucker over many polylines at once. Every round takes all open segments of every route together,
+    finds the farthest interior point of each with one vectorized pass and splits the segments where that point is
+    farther than tolerance_m, so the number of rounds only grows with the depth of the recursion.
+    :param run_starts: first position of each polyline
+    :param run_stops: one past the last position of each polyline
+    :return: boolean array of the points to keep
+    """
+    keep = np.zeros(len(x), dtype=bool)
+    keep[run_starts] = True
+    keep[run_stops - 1] = True
+
+    firsts = run_starts[run_stops - run_starts > 2]
+    lasts = run_stops[run_stops - run_starts > 2] - 1
+
+    while len(firsts):
+        interior = TrajectoryIndex.ranges_to_positions(firsts + 1, lasts)
+        segments = np.repeat(np.arange(len(firsts)), lasts - firsts - 1)
+
+        distances = distances_to_segments(x[interior], y[interior], x[firsts[segments]], y[firsts[segments]],
+                                          x[lasts[segments]], y[lasts[segments]])
+
+        # interior points are grouped by segment, so the farthest one is the first that reaches its segment's max
+        lengths = lasts - firsts - 1
+        maxes = np.maximum.reduceat(distances, np.r_[0, np.cumsum(lengths)[:-1]])
+        candidates = np.flatnonzero(distances == np.repeat(maxes, lengths))
+        farthest = candidates[np.r_[True, segments[candidates][1:] != segments[candidates][:-1]]]
+
+        split = distances[farthest] > tolerance_m
+        points = interior[farthest[split]]
+        keep[points] = True
+
+        firsts, lasts = np.r_[firsts[split], points], np.r_[points, lasts[split]]
+        open_segments = lasts - firsts > 1
+        firsts, lasts = firsts[open_segments], lasts[open_segments]
+
+    return keep
+
+
+def simplify_routes(df, tolerance_m=10.0, max_length_loss=0.05):
+    """
+    Drop near collinear readings from every route before cell mapping, plotting or reference matching. Every
+    dropped reading lies within tolerance_m of the simplified line. Routes whose path length would shrink by more
+    than max_length_loss (mostly GPS jitter while standing still) keep all their readings, so every simplified
+    route's path length stays within that fraction of the original.
+    :param df: labeled data-frame
+    :param tolerance_m: error bound in meters
+    :param max_length_loss: largest allowed relative path length loss per route
+    :return: (simplified readings sorted by route, taxi and time,
+              data-frame per route with reading counts and path lengths before and after)
+    """
+    routes = sort_by_route_and_time(df)
+    route_keys, run_starts, run_stops = contiguous_runs(routes['route_number'].to_numpy())
+    run_lengths = run_stops - run_starts
+
+    # each taxi's part of a shared route number is its own polyline
+    trip_positions = np.flatnonzero(trip_starts(routes))
+    x, y = to_local_meters(routes['latitude'].to_numpy(dtype=float), routes['longitude'].to_numpy(dtype=float))
+    keep = douglas_peucker_mask(x, y, trip_positions, np.r_[trip_positions[1:], len(routes)], tolerance_m)
+
+    segments = segment_distances(routes)
+    kept_segments = segment_distances(routes[keep])
+    distance = np.add.reduceat(segments, run_starts) if len(routes) else np.zeros(0)
+    simplified_distance = np.add.reduceat(kept_segments, np.flatnonzero(np.r_[True, np.diff(
+        routes['route_number'].to_numpy()[keep]) != 0])) if len(routes) else np.zeros(0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        length_ratio = np.where(distance > 0, simplified_distance / distance, 1.0)
+
+    too_short = length_ratio < 1 - max_length_loss
+    keep |= np.repeat(too_short, run_lengths)
+    simplified_distance = np.where(too_short, distance, simplified_distance)
+
+    report = pd.DataFrame({'readings': run_lengths,
+                           'simplified_readings': np.add.reduceat(keep.astype(np.int64), run_starts)
+                           if len(routes) else run_lengths,
+                           'distance_in_km': distance,
+                           'simplified_distance_in_km': simplified_distance},
+                          index=pd.Index(route_keys, name='route_number'))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        report['length_ratio'] = np.where(distance > 0, simplified_distance / distance, 1.0)
+
+    simplified = routes[keep]
+    print('Kept ', len(simplified), ' of ', len(routes), ' readings (compression ratio ',
+          round(len(routes) / max(len(simplified), 1), 2), '), ', int(too_short.sum()),
+          ' routes left as they were to stay within ', max_length_loss * 100, '% of their path length')
+
+    return simplified, report
@@ -0,0 +1,100 @@
+import os
+import pandas as pd
+import numpy as np
+from time_parsing import parse_gps_times
+from segment_trajectories import sort_by_taxi_and_time, occupancy_transitions, add_station_flags
+
+##################################################################
+# Label trajectories chunk by chunk without loading whole files #
+##################################################################
+
+
+def read_csv_in_chunks(file_names, sub_directories, chunk_size, column_numbers=None, column_names=None):
+    """
+    Same as load_csv_as_df but yields bounded chunks from each file in turn.
+    """
+    base_path = os.getcwd()
+
+    for file_name in file_names:
+        full_path = base_path + sub_directories + file_name
+
+        for chunk in pd.read_csv(full_path, usecols=column_numbers, chunksize=chunk_size):
+            if column_names is not None:
+                chunk.columns = column_names
+
+            yield chunk
+
+
+def check_time_order(chunk, last_times):
+    """
+    :param last_times: latest reading time of every taxi in the earlier chunks, None for the first chunk
+    :return: last_times updated with the chunk
+    :raise ValueError: when a taxi has a reading older than its latest reading in an earlier chunk
+    """
+    times = chunk.groupby('taxi_id')['time']
+    if last_times is None:
+        return times.max()
+
+    first_times = times.min()
+    late = first_times < last_times.reindex(first_times.index)
+    if late.any():
+        raise ValueError(str(int(late.sum())) + ' taxis (e.g. ' + str(late[late].index[0]) + ') have readings older '
+                         'than their readings in an earlier chunk, stream_trajectories needs every taxi in time '
+                         'order across chunks and files')
+
+    return pd.concat([last_times, times.max()]).groupby(level=0).max()
+
+
+def stream_trajectories(chunks, trajectory_number=1, station_flags=False):
+    """
+    Label routes across chunk and file boundaries and yield them as soon as they end.
+    Only the readings of routes that are still open are carried from one chunk to the next, so memory is bounded
+    by the chunk size plus the open routes and the last reading time of every taxi. Each taxi's readings have to
+    arrive in time order across chunks and files (within a chunk they are sorted): a chunk with a reading older
+    than a taxi's latest reading in an earlier chunk raises a ValueError instead of silently splitting or dropping
+    routes. Routes are numbered in the order they end, so numbers differ from label_trajectories; routes still
+    open when the data runs out are dropped.
+    :param chunks: iterable of data-frames with taxi_id, time, latitude, longitude and occupancy_status columns
+    :param trajectory_number: number given to the first route that ends
+    :param station_flags: add relevant/airport/train start and end columns
+    :return: generator of data-frames holding the readings of the routes that ended in each chunk
+    """
+    open_routes = None
+    last_times = None
+
+    for chunk in chunks:
+        if not pd.api.types.is_datetime64_any_dtype(chunk['time']):
+            chunk = chunk.assign(time=parse_gps_times(chunk['time']))
+
+        last_times = check_time_order(chunk, last_times)
+
+        if open_routes is not None:
+            chunk = pd.concat([open_routes, chunk])
+
+        chunk, taxi_codes = sort_by_taxi_and_time(chunk)
+        occupied = chunk['occupancy_status'].to_numpy().astype(bool)
+        route_start, route_end = occupancy_transitions(occupied, taxi_codes)
+
+        # carried routes start with their start reading, so every route reading follows its own start
+        route_ids = np.cumsum(route_start)
+        in_route = occupied | route_end
+        ended_ids = route_ids[route_end]
+        ended = in_route & np.isin(route_ids, ended_ids)
+
+        open_routes = chunk[in_route & ~ended]
+
+        if len(ended_ids) == 0:
+            continue
+
+        ended_df = chunk[ended].assign(route_number=trajectory_number + np.searchsorted(ended_ids, route_ids[ended]),
+                                       route_start=route_start[ended],
+                                       route_end=route_end[ended])
+        trajectory_number += len(ended_ids)
+
+        if station_flags:
+            ended_df = add_station_flags(ended_df)
+
+        yield ended_df
+
+    if open_routes is not None and len(open_routes):
+        print('Dropped ', len(open_routes), ' readings from routes that never ended')
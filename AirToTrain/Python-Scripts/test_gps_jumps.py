@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+from segment_trajectories import segment_trajectories
+from gps_jumps import remove_gps_jumps
+from route_features import route_feature_table
+from route_filters import filter_routes
+
+
+def labeled_route(jump_at):
+    """
+    One taxi driving 20 readings north at about 36 km/h with a passenger, the reading at each position in jump_at
+    moved 50 km away.
+    """
+    readings = 22
+    lat = 22.6 + np.arange(readings) * 0.0015
+    long = np.full(readings, 113.9)
+    long[list(jump_at)] += 0.5
+
+    times = pd.Timestamp('2014-04-06 08:00:00') + pd.to_timedelta(np.arange(readings) * 15, unit='s')
+
+    df = pd.DataFrame({'taxi_id': 1,
+                       'time': times,
+                       'latitude': lat,
+                       'longitude': long,
+                       'occupancy_status': np.r_[0, np.ones(readings - 2, dtype=int), 0]})
+
+    df, _ = segment_trajectories(df)
+    return df
+
+
+def test_jumps_on_route_endpoints_keep_the_route():
+    # reading 1 is the route_start reading and reading 21 the route_end reading
+    df = labeled_route(jump_at=[1, 21])
+    route_number = df.loc[df['route_start'], 'route_number'].iloc[0]
+
+    cleaned, jump_df = remove_gps_jumps(df)
+    features = route_feature_table(cleaned)
+    kept, rejections = filter_routes(features)
+
+    assert len(jump_df) == 2
+    assert jump_df['route_start'].any() and jump_df['route_end'].any()
+    assert cleaned.loc[cleaned['route_number'] == route_number, 'route_start'].sum() == 1
+    assert cleaned.loc[cleaned['route_number'] == route_number, 'route_end'].sum() == 1
+
+    assert features.loc[route_number, 'duration_in_seconds'] == 18 * 15
+    assert features.loc[route_number, 'distance_in_km'] < 5
+    assert route_number in kept.index
+    assert len(rejections) == 0
+
+
+def test_repaired_endpoints_keep_their_flags():
+    df = labeled_route(jump_at=[1])
+    route_number = df.loc[df['route_start'], 'route_number'].iloc[0]
+
+    cleaned, jump_df = remove_gps_jumps(df, repair=True)
+    features = route_feature_table(cleaned)
+
+    assert len(jump_df) == 1
+    assert features.loc[route_number, 'duration_in_seconds'] == 20 * 15
+    assert route_number in filter_routes(features)[0].index
@@ -0,0 +1,130 @@
+import math
+import numpy as np
+import pandas as pd
+import pytest
+import kernels
+from segment_trajectories import segment_trajectories
+from route_distances import earth_radius_km, route_segment_distances
+from cell_sequences import match_masks, to_symbols, lcs_lengths
+
+
+@pytest.fixture(params=['numpy', 'numba'])
+def backend(request):
+    if request.param == 'numba':
+        pytest.importorskip('numba')
+
+    kernels.set_backend(request.param)
+    yield request.param
+    kernels.set_backend('numpy')
+
+
+def random_readings(n=3000, taxis=40, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'taxi_id': rng.integers(0, taxis, n),
+                         'time': pd.Timestamp('2014-04-06') + pd.to_timedelta(rng.permutation(n) * 10, unit='s'),
+                         'latitude': 22.5 + rng.random(n) * 0.2,
+                         'longitude': 113.8 + rng.random(n) * 0.3,
+                         'occupancy_status': rng.integers(0, 2, n)})
+
+
+def reference_labels(df, trajectory_number):
+    """
+    The original label_trajectories state machine, walking every taxi's readings with iterrows.
+    :return: data-frame with route_number, route_start and route_end on df's index
+    """
+    labels = []
+    for taxi_id in df['taxi_id'].unique():
+        taxi_df = df.loc[df['taxi_id'] == taxi_id].sort_values(by=['time'])
+        passenger_got_in = False
+
+        for index, row in taxi_df.iterrows():
+            if passenger_got_in and row['occupancy_status']:
+                labels.append((index, trajectory_number, False, False))
+            elif passenger_got_in:
+                passenger_got_in = False
+                labels.append((index, trajectory_number, False, True))
+                trajectory_number += 1
+            elif row['occupancy_status']:
+                passenger_got_in = True
+                labels.append((index, trajectory_number, True, False))
+            else:
+                labels.append((index, -1, False, False))
+
+    labels = pd.DataFrame(labels, columns=['index', 'route_number', 'route_start', 'route_end'])
+    return labels.set_index('index').sort_index(), trajectory_number
+
+
+def reference_route_distances(routes):
+    """
+    Sum of the haversine distance between consecutive readings of each taxi on each route, one pair at a time.
+    """
+    totals = {}
+    for (route_number, _), part in routes.groupby(['route_number', 'taxi_id']):
+        part = part.sort_values('time')
+        points = list(zip(part['latitude'], part['longitude']))
+        total = 0.0
+        for (lat_one, long_one), (lat_two, long_two) in zip(points[:-1], points[1:]):
+            a = math.sin(math.radians(lat_two - lat_one) / 2) ** 2 + math.cos(math.radians(lat_one)) * \
+                math.cos(math.radians(lat_two)) * math.sin(math.radians(long_two - long_one) / 2) ** 2
+            total += 2 * earth_radius_km * math.asin(math.sqrt(a))
+        totals[route_number] = totals.get(route_number, 0.0) + total
+
+    return pd.Series(totals).sort_index()
+
+
+def test_labels_match_the_iterrows_state_machine(backend):
+    df = random_readings()
+    expected, expected_next = reference_labels(df, 5)
+
+    labeled, next_number = segment_trajectories(df, trajectory_number=5)
+    labeled = labeled.sort_index()
+
+    assert next_number == expected_next
+    assert np.array_equal(labeled['route_number'].to_numpy(), expected['route_number'].to_numpy())
+    assert np.array_equal(labeled['route_start'].to_numpy(), expected['route_start'].to_numpy())
+    assert np.array_equal(labeled['route_end'].to_numpy(), expected['route_end'].to_numpy())
+
+
+def test_open_route_shares_its_number_with_the_next_route(backend):
+    # taxi 'a' ends its readings with a passenger, so taxi 'b's first route gets the same number
+    times = pd.Timestamp('2014-04-06 08:00:00') + pd.to_timedelta(np.arange(4) * 60, unit='s')
+    df = pd.DataFrame({'taxi_id': ['a'] * 4 + ['b'] * 4,
+                       'time': np.r_[times, times],
+                       'latitude': 22.6,
+                       'longitude': 113.9,
+                       'occupancy_status': [0, 1, 1, 1, 1, 1, 0, 0]})
+
+    labeled, next_number = segment_trajectories(df)
+    expected, expected_next = reference_labels(df, 1)
+
+    assert list(labeled['route_number']) == [-1, 1, 1, 1, 1, 1, 1, -1]
+    assert list(labeled['route_number']) == list(expected['route_number'])
+    assert next_number == expected_next == 2
+
+
+def test_route_distances_match_pairwise_haversine(backend):
+    labeled, _ = segment_trajectories(random_readings(seed=1))
+    routes, route_distances = route_segment_distances(labeled)
+    expected = reference_route_distances(routes)
+
+    assert np.array_equal(route_distances.index.to_numpy(), expected.index.to_numpy())
+    assert np.allclose(route_distances.to_numpy(), expected.to_numpy(), rtol=1e-9, atol=1e-9)
+
+
+def test_lcs_lengths_match_dynamic_programming(backend):
+    rng = np.random.default_rng(2)
+    paths = [rng.integers(0, 30, length) for length in (5, 64, 90)]
+    sequences = [rng.integers(0, 40, length) for length in (0, 1, 20, 70, 130)]
+
+    alphabet, masks, lengths = match_masks(paths)
+    offsets = np.r_[0, np.cumsum([len(sequence) for sequence in sequences])].astype(np.int64)
+    result = lcs_lengths(to_symbols(np.concatenate(sequences), alphabet), offsets, masks, lengths)
+
+    for i, sequence in enumerate(sequences):
+        for j, path in enumerate(paths):
+            table = np.zeros((len(sequence) + 1, len(path) + 1), dtype=np.int64)
+            for a in range(len(sequence)):
+                for b in range(len(path)):
+                    table[a + 1, b + 1] = table[a, b] + 1 if sequence[a] == path[b] else \
+                        max(table[a, b + 1], table[a + 1, b])
+            assert result[i, j] == table[-1, -1]
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+import kernels
+from route_distances import haversine_km, route_segment_distances
+from route_features import segment_gaps
+from simplify_routes import simplify_routes
+
+
+def shared_route():
+    """
+    Route 7 of two taxis: taxi 'b' ends its readings with the route still open, which gives it the number of
+    taxi 'a's route (the label_trajectories quirk). The two parts are 20 km apart and their times interleave.
+    """
+    times = pd.Timestamp('2014-04-06 08:00:00') + pd.to_timedelta(np.arange(4) * 30, unit='s')
+    return pd.DataFrame({'taxi_id': ['b', 'a', 'b', 'a', 'b', 'a', 'b', 'a'],
+                         'time': np.repeat(times, 2),
+                         'latitude': [22.5, 22.7, 22.501, 22.701, 22.502, 22.702, 22.503, 22.703],
+                         'longitude': 113.9,
+                         'route_number': 7})
+
+
+def part_length(df, taxi_id):
+    part = df[df['taxi_id'] == taxi_id].sort_values('time')
+    lat, long = part['latitude'].to_numpy(), part['longitude'].to_numpy()
+    return haversine_km(lat[:-1], long[:-1], lat[1:], long[1:]).sum()
+
+
+@pytest.mark.parametrize('backend', ['numpy', 'numba'])
+def test_shared_route_number_adds_no_hop_between_taxis(backend):
+    if backend == 'numba':
+        pytest.importorskip('numba')
+    df = shared_route()
+
+    kernels.set_backend(backend)
+    try:
+        routes, route_distances = route_segment_distances(df)
+    finally:
+        kernels.set_backend('numpy')
+
+    assert list(routes['taxi_id']) == ['a'] * 4 + ['b'] * 4
+    assert routes['segment_distance_km'].iloc[4] == 0
+    assert route_distances.loc[7] == pytest.approx(part_length(df, 'a') + part_length(df, 'b'))
+    assert route_distances.loc[7] < 1
+
+
+def test_shared_route_number_gaps_and_simplification():
+    df = shared_route()
+    routes, _ = route_segment_distances(df)
+
+    assert list(segment_gaps(routes)) == [0, 30, 30, 30, 0, 30, 30, 30]
+
+    simplified, report = simplify_routes(df)
+    assert set(simplified['taxi_id']) == {'a', 'b'}
+    assert report.loc[7, 'simplified_distance_in_km'] == pytest.approx(report.loc[7, 'distance_in_km'])
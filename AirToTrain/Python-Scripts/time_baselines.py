@@ -0,0 +1,80 @@
+import numpy as np
+from regions import shenzhen_regions
+from route_summary import classify_endpoints
+
+##########################################################################
+# Trip time and distance baselines per OD pair, hour and day of the week #
+##########################################################################
+
+pair_keys = ['start_region', 'end_region']
+bucket_keys = pair_keys + ['start_hour', 'day_type']
+baseline_features = ['duration_in_seconds', 'distance_in_km']
+
+
+def add_time_buckets(features, registry=shenzhen_regions):
+    """
+    Add start_region/end_region (when missing), start_hour and day_type ('weekday' or 'weekend') to a route
+    feature table.
+    """
+    if 'start_region' not in features.columns:
+        features = classify_endpoints(features, registry)
+
+    start_times = features['start_time']
+    return features.assign(start_hour=start_times.dt.hour,
+                           day_type=np.where(start_times.dt.dayofweek >= 5, 'weekend', 'weekday'))
+
+
+def aggregate_baselines(features, keys):
+    grouped = features.groupby(keys)
+    baselines = grouped.size().to_frame('route_count')
+
+    for feature in baseline_features:
+        baselines[feature + '_mean'] = grouped[feature].mean()
+        baselines[feature + '_std'] = grouped[feature].std()
+
+    return baselines
+
+
+def build_time_baselines(history, registry=shenzhen_regions):
+    """
+    One grouped aggregation over the feature table of every historical route.
+    :param history: route feature table, as many days as available
+    :return: (baselines indexed by (start_region, end_region, start_hour, day_type),
+              baselines indexed by (start_region, end_region) for buckets with too little history)
+    """
+    history = add_time_buckets(history, registry).dropna(subset=pair_keys)
+
+    return aggregate_baselines(history, bucket_keys), aggregate_baselines(history, pair_keys)
+
+
+def score_against_time_baselines(features, baselines, min_routes=20, z_cutoff=2.0, registry=shenzhen_regions):
+    """
+    Compare every route with routes of the same OD pair at the same hour on the same kind of day, so a slow trip in
+    rush hour isn't mistaken for a detour. Buckets with fewer than min_routes routes fall back to the whole pair.
+    Both lookups are hash joins on the baseline index, O(1) per route however long the history is.
+    :param features: route feature table to score
+    :param baselines: output of build_time_baselines
+    :return: features with duration_z, distance_z, baseline ('bucket', 'pair' or None) and suspected_fraud
+             (both z-scores at or above z_cutoff)
+    """
+    bucket_baselines, pair_baselines = baselines
+    features = add_time_buckets(features, registry)
+
+    scored = features.join(bucket_baselines, on=bucket_keys)
+    pair_scored = features.join(pair_baselines, on=pair_keys)
+
+    use_bucket = (scored['route_count'] >= min_routes).to_numpy()
+    use_pair = ~use_bucket & (pair_scored['route_count'] >= min_routes).to_numpy()
+
+    for feature, short_name in zip(baseline_features, ['duration_z', 'distance_z']):
+        mean = np.where(use_bucket, scored[feature + '_mean'], pair_scored[feature + '_mean'])
+        std = np.where(use_bucket, scored[feature + '_std'], pair_scored[feature + '_std'])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = (features[feature].to_numpy(dtype=float) - mean) / std
+        features[short_name] = np.where(use_bucket | use_pair, z, np.nan)
+
+    features['baseline'] = np.where(use_bucket, 'bucket', np.where(use_pair, 'pair', None))
+    features['suspected_fraud'] = (features['duration_z'] >= z_cutoff) & (features['distance_z'] >= z_cutoff)
+
+    return features
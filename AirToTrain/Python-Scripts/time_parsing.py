@@ -0,0 +1,85 @@
+import time
+import pandas as pd
+import numpy as np
+
+####################################################
+# Parse the GPS feed's fixed timestamp layout fast #
+####################################################
+
+gps_time_format = '%Y-%m-%d %H:%M:%S'
+
+
+def lookup(s):
+    """
+    This is an extremely fast approach to datetime parsing.
+    For large data, the same dates are often repeated. Rather than
+    re-parse these, we store all unique dates, parse them, and
+    use a lookup to convert all dates.
+
+    Superseded by parse_gps_times, kept for benchmark_time_parsing.
+    """
+    dates = {date: pd.to_datetime(date) for date in s.unique()}
+    return s.map(dates)
+
+
+def parse_gps_times(s):
+    """
+    Replacement for lookup(). Parses the GPS feed's fixed timestamp layout for the whole column in one vectorized
+    call; only strings that don't follow it go through pd.to_datetime's format guessing and anything unparseable
+    becomes NaT. Integer columns are taken as epoch seconds. Already parsed columns are returned as they are, so
+    every stage can call it without paying for the parse again.
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+
+    if pd.api.types.is_integer_dtype(s):
+        return pd.to_datetime(s, unit='s')
+
+    parsed = pd.to_datetime(s, format=gps_time_format, errors='coerce')
+    failed = parsed.isnull() & s.notnull()
+
+    if failed.any():
+        parsed[failed] = pd.to_datetime(s[failed], errors='coerce')
+
+    return parsed
+
+
+def to_epoch_seconds(s):
+    """
+    Whole column to int64 epoch seconds, whether it holds raw strings, parsed datetimes or epoch seconds already.
+    NaT comes back as the minimum int64.
+    """
+    if pd.api.types.is_integer_dtype(s):
+        return s.to_numpy(dtype=np.int64)
+
+    return parse_gps_times(s).to_numpy(dtype='datetime64[s]').view(np.int64)
+
+
+def benchmark_time_parsing(s, repeat=1):
+    """
+    Time lookup(), pd.to_datetime with the layout given, and parse_gps_times on the same column.
+    :return: data-frame with seconds per parser
+    """
+    parsers = [('lookup', lookup),
+               ('to_datetime', lambda col: pd.to_datetime(col, format='%Y-%m-%d %H:%M:%S')),
+               ('parse_gps_times', parse_gps_times)]
+    results = []
+    expected = None
+
+    for name, parser in parsers:
+        start = time.time()
+        for _ in range(repeat):
+            parsed = parser(s)
+        results.append((name, (time.time() - start) / repeat))
+
+        parsed = to_epoch_seconds(parsed)
+        if expected is None:
+            expected = parsed
+        elif not np.array_equal(parsed, expected):
+            print(name, ' disagrees with lookup()!')
+
+    results_df = pd.DataFrame(results, columns=['parser', 'seconds'])
+    results_df['speedup'] = results_df['seconds'].iloc[0] / results_df['seconds']
+    print(results_df)
+
+    return results_df
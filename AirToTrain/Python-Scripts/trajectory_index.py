@@ -0,0 +1,145 @@
+import os
+import pandas as pd
+import numpy as np
+from time_parsing import to_epoch_seconds
+from columnar_store import save_df_as_parquet, load_parquet_as_df
+
+##################################################################
+# Keep readings sorted by taxi and time and slice them by offset #
+##################################################################
+
+
+def contiguous_runs(keys):
+    """
+    :param keys: array of keys
+    :return: (key of each run of equal neighbours, run starts, run stops)
+    """
+    if len(keys) == 0:
+        return keys[:0], np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    stops = np.r_[starts[1:], len(keys)]
+
+    return keys[starts], starts, stops
+
+
+class TrajectoryIndex(object):
+    """
+    Readings sorted by (taxi_id, time) plus offset tables, so a taxi or a route is one or a few contiguous slices
+    found with a binary search instead of a scan over the whole data-frame.
+    Routes are contiguous within a taxi; the few route numbers shared by two taxis (a route that never ended
+    followed by the next taxi's first route) simply have two runs.
+    """
+
+    def __init__(self, df, offsets=None):
+        """
+        :param df: GPS data-frame, sorted here unless offsets from save() are passed with the already sorted df
+        :param offsets: dict of offset arrays written by save()
+        """
+        if offsets is None:
+            taxi_codes, _ = pd.factorize(df['taxi_id'], sort=True)
+            order = np.lexsort((to_epoch_seconds(df['time']), taxi_codes))
+            df = df.iloc[order]
+
+            taxi_keys, taxi_starts, _ = contiguous_runs(df['taxi_id'].to_numpy())
+            offsets = {'taxi_keys': taxi_keys, 'taxi_offsets': np.r_[taxi_starts, len(df)]}
+
+            if 'route_number' in df.columns:
+                route_keys, route_starts, route_stops = contiguous_runs(df['route_number'].to_numpy())
+                run_order = np.lexsort((route_starts, route_keys))
+                offsets['route_keys'] = route_keys[run_order]
+                offsets['route_starts'] = route_starts[run_order]
+                offsets['route_stops'] = route_stops[run_order]
+
+        self.df = df
+        self.offsets = offsets
+        self.taxi_keys = offsets['taxi_keys']
+        self.taxi_offsets = offsets['taxi_offsets']
+        self.route_keys = offsets.get('route_keys')
+        self.route_starts = offsets.get('route_starts')
+        self.route_stops = offsets.get('route_stops')
+
+    @staticmethod
+    def ranges_to_positions(starts, stops):
+        non_empty = stops > starts
+        starts, stops = starts[non_empty], stops[non_empty]
+        lengths = stops - starts
+
+        if len(lengths) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        # arange over every range at once
+        steps = np.ones(lengths.sum(), dtype=np.int64)
+        steps[0] = starts[0]
+        ends = np.cumsum(lengths)[:-1]
+        steps[ends] = starts[1:] - stops[:-1] + 1
+
+        return np.cumsum(steps)
+
+    def taxi(self, taxi_id):
+        i = np.searchsorted(self.taxi_keys, taxi_id)
+        if i == len(self.taxi_keys) or self.taxi_keys[i] != taxi_id:
+            return self.df.iloc[0:0]
+
+        return self.df.iloc[self.taxi_offsets[i]:self.taxi_offsets[i + 1]]
+
+    def taxis(self, taxi_ids):
+        """
+        Readings of every taxi in taxi_ids, like df[df['taxi_id'].isin(taxi_ids)] without the scan.
+        """
+        taxi_ids = np.intersect1d(np.asarray(taxi_ids, dtype=self.taxi_keys.dtype), self.taxi_keys)
+        found = np.searchsorted(self.taxi_keys, taxi_ids)
+
+        return self.df.iloc[self.ranges_to_positions(self.taxi_offsets[found], self.taxi_offsets[found + 1])]
+
+    def route_runs(self, route_numbers):
+        """
+        :return: (run starts, run stops, number of runs per requested route) in the order requested
+        """
+        route_numbers = np.asarray(route_numbers, dtype=self.route_keys.dtype)
+        first = np.searchsorted(self.route_keys, route_numbers, side='left')
+        last = np.searchsorted(self.route_keys, route_numbers, side='right')
+
+        runs = self.ranges_to_positions(first, last)
+        return self.route_starts[runs], self.route_stops[runs], last - first
+
+    def route(self, route_number):
+        return self.routes([route_number])
+
+    def routes(self, route_numbers):
+        """
+        Readings of every route in route_numbers, grouped by route in the order given.
+        """
+        starts, stops, _ = self.route_runs(route_numbers)
+        return self.df.iloc[self.ranges_to_positions(starts, stops)]
+
+    def route_lengths(self):
+        """
+        :return: series of reading counts indexed by route number
+        """
+        lengths = pd.Series(self.route_stops - self.route_starts, index=self.route_keys)
+        return lengths.groupby(level=0).sum()
+
+    def save(self, file_name, sub_directories='/'):
+        """
+        Persist the sorted readings (parquet) and the offsets (npz next to it).
+        """
+        save_df_as_parquet(self.df, file_name, sub_directories)
+
+        offsets = {key: np.asarray(value) for key, value in self.offsets.items()}
+        if offsets['taxi_keys'].dtype == object:
+            offsets['taxi_keys'] = offsets['taxi_keys'].astype(str)
+
+        np.savez(os.getcwd() + sub_directories + file_name + '.offsets.npz', **offsets)
+
+
+def load_trajectory_index(file_name, sub_directories='/'):
+    df = load_parquet_as_df(file_name, sub_directories)
+
+    with np.load(os.getcwd() + sub_directories + file_name + '.offsets.npz') as saved:
+        offsets = {key: saved[key] for key in saved.files}
+
+    if offsets['taxi_keys'].dtype.kind == 'U':
+        offsets['taxi_keys'] = offsets['taxi_keys'].astype(object)
+
+    return TrajectoryIndex(df, offsets)
@@ -0,0 +1,170 @@
+import os
+import json
+import pandas as pd
+import numpy as np
+from functools import partial
+from multiprocessing import Pool
+from time_parsing import to_epoch_seconds
+from trajectory_index import contiguous_runs
+
+###########################################################
+# Fixed width per route arrays on disk, opened as memmaps #
+###########################################################
+
+store_columns = {
+    'latitude': '<f8',
+    'longitude': '<f8',
+    'time': '<i8',
+    'occupancy_status': '|u1',
+}
+
+
+def write_trajectory_store(df, store_name, sub_directories='/'):
+    """
+    Write every route's readings as contiguous fixed width column files (time as epoch seconds) plus a run
+    offset table. Readings are sorted by route number, taxi and time, so the few route numbers shared by two taxis
+    (see TrajectoryIndex) are one run per taxi instead of both taxis' readings interleaved by time.
+    Readings outside a route (route_number -1) are left out.
+    :return: path of the store directory
+    """
+    store_path = os.getcwd() + sub_directories + store_name
+    os.makedirs(store_path, exist_ok=True)
+
+    routes = df[df['route_number'] != -1]
+    times = to_epoch_seconds(routes['time'])
+    taxi_codes, taxi_ids = pd.factorize(routes['taxi_id'], sort=True)
+    order = np.lexsort((times, taxi_codes, routes['route_number'].to_numpy()))
+
+    route_numbers = routes['route_number'].to_numpy()[order]
+    taxi_codes = taxi_codes[order]
+    columns = {'latitude': routes['latitude'].to_numpy()[order],
+               'longitude': routes['longitude'].to_numpy()[order],
+               'time': times[order],
+               'occupancy_status': routes['occupancy_status'].to_numpy()[order]}
+
+    for col, dtype in store_columns.items():
+        columns[col].astype(dtype).tofile(os.path.join(store_path, col + '.bin'))
+
+    # one run per (route number, taxi)
+    _, starts, stops = contiguous_runs(route_numbers * len(taxi_ids) + taxi_codes)
+    offsets = pd.DataFrame({'route_number': route_numbers[starts], 'taxi_id': np.asarray(taxi_ids)[taxi_codes[starts]],
+                            'start': starts, 'stop': stops})
+    offsets.to_csv(os.path.join(store_path, 'route_offsets.csv'), index=False)
+
+    with open(os.path.join(store_path, 'store.json'), 'w') as f:
+        json.dump({'readings': int(len(route_numbers)), 'columns': store_columns}, f)
+
+    print('Stored ', offsets['route_number'].nunique(), ' routes with ', len(route_numbers), ' readings in ',
+          store_path)
+    return store_path
+
+
+class TrajectoryStore(object):
+    """
+    Read only view of a store written by write_trajectory_store. Column files are np.memmap'd, so a route is a
+    slice of each column (no copy) and worker processes that open the same store share the OS page cache instead
+    of each loading the data. Pickling only sends the path, but unpickling reopens the store, so map_routes opens
+    it once per worker instead of sending it with every route.
+    """
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+
+        with open(os.path.join(store_path, 'store.json')) as f:
+            meta = json.load(f)
+
+        self.columns = {}
+        for col, dtype in meta['columns'].items():
+            if meta['readings']:
+                self.columns[col] = np.memmap(os.path.join(store_path, col + '.bin'), dtype=dtype, mode='r',
+                                              shape=(meta['readings'],))
+            else:
+                self.columns[col] = np.zeros(0, dtype=dtype)
+
+        # runs of a shared route number are next to each other, so every route is still one slice
+        self.runs = pd.read_csv(os.path.join(store_path, 'route_offsets.csv'))
+        self.route_numbers, first_runs, last_runs = contiguous_runs(self.runs['route_number'].to_numpy())
+        self.starts = self.runs['start'].to_numpy()[first_runs]
+        self.stops = self.runs['stop'].to_numpy()[last_runs - 1]
+
+    def __reduce__(self):
+        return TrajectoryStore, (self.store_path,)
+
+    def __len__(self):
+        return len(self.route_numbers)
+
+    def route_index(self, route_number):
+        i = np.searchsorted(self.route_numbers, route_number)
+        if i == len(self.route_numbers) or self.route_numbers[i] != route_number:
+            raise KeyError('Route ' + str(route_number) + ' is not in the store')
+
+        return i
+
+    def route_slice(self, route_number):
+        i = self.route_index(route_number)
+        return slice(self.starts[i], self.stops[i])
+
+    def route_runs(self, route_number):
+        """
+        :return: data-frame with the taxi_id, start and stop of each taxi's run of the route, usually one
+        """
+        runs = self.runs[self.runs['route_number'] == route_number]
+        if len(runs) == 0:
+            raise KeyError('Route ' + str(route_number) + ' is not in the store')
+
+        return runs
+
+    def route(self, route_number):
+        """
+        :return: dict of zero copy column views for one route, time in epoch seconds
+        """
+        readings = self.route_slice(route_number)
+        return {col: values[readings] for col, values in self.columns.items()}
+
+    def route_df(self, route_number):
+        """
+        Copy of one route as a data-frame with parsed times and taxi ids, for plotting and the older helpers.
+        """
+        columns = self.route(route_number)
+        df = pd.DataFrame({col: np.array(values) for col, values in columns.items()})
+        df['time'] = pd.to_datetime(df['time'], unit='s')
+        df['route_number'] = route_number
+
+        runs = self.route_runs(route_number)
+        df['taxi_id'] = np.repeat(runs['taxi_id'].to_numpy(), (runs['stop'] - runs['start']).to_numpy())
+
+        return df
+
+    def route_lengths(self):
+        return pd.Series(self.stops - self.starts, index=self.route_numbers)
+
+
+def open_trajectory_store(store_name, sub_directories='/'):
+    return TrajectoryStore(os.getcwd() + sub_directories + store_name)
+
+
+# store opened by open_worker_store in every map_routes worker process
+worker_store = None
+
+
+def open_worker_store(store_path):
+    global worker_store
+    worker_store = TrajectoryStore(store_path)
+
+
+def call_with_worker_store(func, route_number):
+    return func(worker_store, route_number)
+
+
+def map_routes(store, func, route_numbers=None, processes=None):
+    """
+    Run func(store, route_number) over routes in a process pool. Every worker opens the store once when it
+    starts and tasks only carry route numbers; the routes are read straight from the shared memory mapped files.
+    :param func: module level function (it is pickled by name)
+    :return: list of results in route order
+    """
+    if route_numbers is None:
+        route_numbers = store.route_numbers.tolist()
+
+    with Pool(processes, initializer=open_worker_store, initargs=(store.store_path,)) as pool:
+        return pool.map(partial(call_with_worker_store, func), route_numbers)
@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from regions import shenzhen_regions
+from route_summary import route_endpoints, classify_endpoints
+from grid_cells import CellGrid, default_cell_grid
+from cell_sequences import trip_cell_paths
+
+##################################################################
+# Cell-to-cell transition counts of historical trips per OD pair #
+##################################################################
+
+
+def route_pairs(df, endpoints=None, registry=shenzhen_regions):
+    """
+    :param endpoints: endpoint or feature table of the routes in df, built from df when missing
+    :return: data-frame indexed by route_number with start_region and end_region
+    """
+    if endpoints is None:
+        endpoints = route_endpoints(df)
+    if 'start_region' not in endpoints.columns:
+        endpoints = classify_endpoints(endpoints, registry)
+
+    return endpoints[['start_region', 'end_region']]
+
+
+def cell_transitions(df, grid=default_cell_grid, cell_column='cell_id'):
+    """
+    Moves between consecutive distinct cells of every route.
+    :return: (route number, from cell, to cell) arrays, one entry per move
+    """
+    trip_numbers, cells, offsets = trip_cell_paths(df, grid, cell_column)
+    route_numbers = np.repeat(trip_numbers, np.diff(offsets))
+
+    moves = np.flatnonzero(route_numbers[1:] == route_numbers[:-1])
+    return route_numbers[moves], cells[moves], cells[moves + 1]
+
+
+class CellTransitionModel(object):
+    """
+    How often historical trips of each (origin hub, destination hub) pair moved from one grid cell to the next, in
+    one sparse matrix with a block of rows per pair: row pair * cells + from cell, column to cell, where cells is
+    the number of grid cells.
+    New part files are counted on top and new pairs only add row blocks, so the model never has to be rebuilt.
+    """
+
+    def __init__(self, grid=default_cell_grid, smoothing=1.0):
+        """
+        :param smoothing: pseudo count spread evenly over the moves out of every cell, so moves never seen still get
+                          a small probability
+        """
+        self.grid = grid
+        self.smoothing = smoothing
+        self.cells = grid.rows * grid.columns
+        self.pairs = []
+        self.pair_ids = {}
+        self.route_counts = np.zeros(0, dtype=np.int64)
+        self.counts = sparse.csr_matrix((0, self.cells), dtype=np.int64)
+
+    def pair_id(self, origin, destination):
+        key = (origin, destination)
+        if key not in self.pair_ids:
+            self.pair_ids[key] = len(self.pairs)
+            self.pairs.append(key)
+
+        return self.pair_ids[key]
+
+    def transition_rows(self, route_numbers, pairs, add_pairs=False):
+        """
+        :param pairs: route_pairs table
+        :return: pair id of every route number, -1 for routes without a hub at both ends (or an unknown pair when
+                 add_pairs is False)
+        """
+        pairs = pairs.dropna(subset=['start_region', 'end_region'])
+        keys = zip(pairs['start_region'], pairs['end_region'])
+        ids = [self.pair_id(*key) for key in keys] if add_pairs else [self.pair_ids.get(key, -1) for key in keys]
+
+        pair_of_route = pd.Series(ids, index=pairs.index, dtype=np.int64)
+        return pair_of_route.reindex(route_numbers).fillna(-1).to_numpy(dtype=np.int64)
+
+    def grow(self):
+        """
+        Add row blocks and route counts for pairs seen for the first time.
+        """
+        self.counts.resize((len(self.pairs) * self.cells, self.cells))
+        self.route_counts = np.r_[self.route_counts, np.zeros(len(self.pairs) - len(self.route_counts),
+                                                              dtype=np.int64)]
+
+    def update(self, df, endpoints=None, registry=shenzhen_regions, cell_column='cell_id'):
+        """
+        Count the moves of every hub to hub route in df (one part file, one day...).
+        """
+        pairs = route_pairs(df, endpoints, registry)
+        route_numbers, from_cells, to_cells = cell_transitions(df, self.grid, cell_column)
+        pair_ids = self.transition_rows(route_numbers, pairs, add_pairs=True)
+        self.grow()
+
+        known = pair_ids >= 0
+        rows = pair_ids[known] * self.cells + from_cells[known]
+        self.counts = self.counts + sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, to_cells[known])),
+                                                      shape=self.counts.shape)
+
+        route_pair_ids = self.transition_rows(pairs.index.to_numpy(), pairs)
+        self.route_counts += np.bincount(route_pair_ids[route_pair_ids >= 0], minlength=len(self.pairs))
+
+        return self
+
+    def merge(self, other):
+        """
+        Add the counts of a model of other part files, pairs matched by name.
+        """
+        for origin, destination in other.pairs:
+            self.pair_id(origin, destination)
+        self.grow()
+
+        other_ids = np.array([self.pair_ids[pair] for pair in other.pairs], dtype=np.int64)
+        counts = other.counts.tocoo()
+        rows = other_ids[counts.row // other.cells] * self.cells + counts.row % other.cells
+        self.counts = self.counts + sparse.csr_matrix((counts.data, (rows, counts.col)), shape=self.counts.shape)
+        self.route_counts[other_ids] += other.route_counts
+
+        return self
+
+    def score(self, df, endpoints=None, min_routes=20, log_likelihood_cutoff=-1.5, registry=shenzhen_regions,
+              cell_column='cell_id'):
+        """
+        Average log-likelihood of every route's moves under the smoothed transition probabilities of its OD pair,
+        (count + smoothing / cells) / (moves out of the cell + smoothing), looked up for all moves at once.
+        :param min_routes: pairs with fewer historical routes are not scored
+        :return: data-frame indexed by route_number with transitions, pair_routes, log_likelihood (NaN when not
+                 scored) and suspected_fraud (log_likelihood below log_likelihood_cutoff)
+        """
+        pairs = route_pairs(df, endpoints, registry)
+        route_numbers, from_cells, to_cells = cell_transitions(df, self.grid, cell_column)
+        pair_ids = self.transition_rows(route_numbers, pairs)
+
+        known = pair_ids >= 0
+        rows = pair_ids[known] * self.cells + from_cells[known]
+        moves = np.asarray(self.counts[rows, to_cells[known]]).ravel()
+        totals = np.asarray(self.counts.sum(axis=1)).ravel()[rows]
+
+        log_likelihoods = np.full(len(route_numbers), np.nan)
+        log_likelihoods[known] = np.log((moves + self.smoothing / self.cells) / (totals + self.smoothing))
+
+        trip_numbers = np.unique(np.r_[pairs.index.to_numpy(), route_numbers])
+        positions = np.searchsorted(trip_numbers, route_numbers)
+        transitions = np.bincount(positions, minlength=len(trip_numbers))
+        sums = np.bincount(positions, weights=log_likelihoods, minlength=len(trip_numbers))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_likelihood = sums / transitions
+
+        route_pair_ids = self.transition_rows(trip_numbers, pairs)
+        pair_routes = np.where(route_pair_ids >= 0, np.r_[self.route_counts, 0][route_pair_ids], 0)
+        log_likelihood = np.where(pair_routes >= min_routes, log_likelihood, np.nan)
+
+        scores = pd.DataFrame({'transitions': transitions,
+                               'pair_routes': pair_routes,
+                               'log_likelihood': log_likelihood,
+                               'suspected_fraud': log_likelihood < log_likelihood_cutoff},
+                              index=pd.Index(trip_numbers, name='route_number'))
+
+        print(int(scores['suspected_fraud'].sum()), ' of ', int(scores['log_likelihood'].notna().sum()),
+              ' scored routes have an average move log-likelihood below ', log_likelihood_cutoff)
+        return scores
+
+    def save(self, file_name):
+        counts = self.counts.tocoo()
+        np.savez_compressed(file_name, rows=counts.row, cols=counts.col, data=counts.data,
+                            origins=np.array([origin for origin, _ in self.pairs], dtype=str),
+                            destinations=np.array([destination for _, destination in self.pairs], dtype=str),
+                            route_counts=self.route_counts, smoothing=self.smoothing,
+                            grid=[self.grid.min_lat, self.grid.min_long, self.grid.cell_size, self.grid.max_lat,
+                                  self.grid.max_long])
+
+
+def load_transition_model(file_name):
+    saved = np.load(file_name)
+    min_lat, min_long, cell_size, max_lat, max_long = saved['grid']
+
+    model = CellTransitionModel(CellGrid(min_lat, min_long, cell_size, max_lat, max_long), float(saved['smoothing']))
+    for origin, destination in zip(saved['origins'], saved['destinations']):
+        model.pair_id(str(origin), str(destination))
+    model.grow()
+
+    model.counts = sparse.csr_matrix((saved['data'], (saved['rows'], saved['cols'])), shape=model.counts.shape)
+    model.route_counts = saved['route_counts']
+
+    return model